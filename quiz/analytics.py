@@ -0,0 +1,117 @@
+"""Post-game answer analytics over the columnar answer log.
+
+The session's chunks are mapped straight into NumPy arrays and every
+statistic is computed for all questions at once: counts and accuracy with
+``bincount``, option histograms with one ``bincount`` over
+``question * options + option``, and latency percentiles by sorting once
+on (question, latency) and indexing each question's run.
+"""
+import numpy as np
+
+from . import answers
+from .models import AnswerChunk
+
+PERCENTILES = (50, 90, 99)
+
+
+def load_columns(session_id):
+    """The session's answers, flushed and pending, as one array per column."""
+    blobs = list(
+        AnswerChunk.objects.filter(session_id=session_id).order_by('id').values_list('count', 'data')
+    )
+    count, pending = answers.pending_data(session_id)
+    if count:
+        blobs.append((count, pending))
+    return decode_chunks(blobs)
+
+
+def decode_chunks(blobs):
+    """``(count, data)`` chunks -> one array per column."""
+    parts = {name: [] for name, _, _ in answers.COLUMNS}
+    for count, data in blobs:
+        # Database drivers may hand back memoryviews
+        data = bytes(data)
+        offset = 0
+        for name, _, dtype in answers.COLUMNS:
+            column = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            parts[name].append(column)
+            offset += column.nbytes
+    return {
+        name: np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype)
+        for name, _, dtype in answers.COLUMNS
+    }
+
+
+def _rounded(values, digits=3):
+    return [None if np.isnan(value) else round(value, digits) for value in values.tolist()]
+
+
+def report(columns, compiled, hardest=5):
+    """Per-question statistics and the hardest questions of a session."""
+    total = compiled.total_questions
+    width = max((len(p['options']) for p in compiled.payloads), default=0) or 1
+    question = columns['question'].astype(np.intp)
+    option = columns['option'].astype(np.intp)
+    latency = columns['latency'].astype(np.float64)
+    # Answers to questions the quiz no longer has (edited since) are ignored
+    keep = question < total
+    if not keep.all():
+        question, option, latency = question[keep], option[keep], latency[keep]
+        player = columns['player_id'][keep]
+    else:
+        player = columns['player_id']
+
+    counts = np.bincount(question, minlength=total)
+    key = np.array([a if type(a) is int else -2 for a in compiled.correct_answers], dtype=np.intp)
+    correct = np.bincount(question, weights=option == key[question], minlength=total)
+    valid = (option >= 0) & (option < width)
+    histogram = np.bincount(
+        question[valid] * width + option[valid], minlength=total * width
+    ).reshape(total, width)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        accuracy = correct / counts
+        mean_latency = np.bincount(question, weights=latency, minlength=total) / counts
+
+    # Nearest-rank percentiles: sorted by question then latency, each
+    # question's answers are one run starting at ``starts``
+    ordered = latency[np.lexsort((latency, question))]
+    starts = np.cumsum(counts) - counts
+    percentiles = {}
+    for p in PERCENTILES:
+        rank = np.maximum(np.ceil(counts * p / 100).astype(np.intp) - 1, 0)
+        index = np.minimum(starts + rank, max(len(ordered) - 1, 0))
+        values = ordered[index] if len(ordered) else np.zeros(total)
+        percentiles[p] = np.where(counts > 0, values, np.nan)
+
+    answered = np.flatnonzero(counts)
+    hardest_order = answered[np.argsort(accuracy[answered], kind='stable')][:hardest]
+
+    accuracy_list = _rounded(accuracy, 4)
+    mean_list = _rounded(mean_latency)
+    percentile_lists = {p: _rounded(values) for p, values in percentiles.items()}
+    questions = []
+    for index, payload in enumerate(compiled.payloads):
+        options = len(payload['options'])
+        questions.append({
+            'index': index,
+            'question': payload['question'],
+            'answers': int(counts[index]),
+            'accuracy': accuracy_list[index],
+            'options': histogram[index, :options].tolist(),
+            'correct_answer': compiled.correct_answers[index],
+            'latency': {
+                'mean': mean_list[index],
+                **{f'p{p}': percentile_lists[p][index] for p in PERCENTILES},
+            },
+        })
+    return {
+        'total_answers': int(counts.sum()),
+        'players': int(np.unique(player).size),
+        'questions': questions,
+        'hardest': [
+            {'index': int(index), 'question': compiled.payloads[index]['question'],
+             'accuracy': accuracy_list[index]}
+            for index in hardest_order
+        ],
+    }
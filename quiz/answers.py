@@ -0,0 +1,127 @@
+"""Append-only answer log, stored column by column.
+
+Every scored answer is appended to per-session arrays in memory; the
+write-behind thread turns what accumulated since the last flush into one
+``AnswerChunk`` row per session, so a question answered by 2,000 players
+costs a single insert. A chunk's ``data`` is its columns back to back,
+little-endian:
+
+    player_id   int64
+    question    uint16
+    option      int16    (-1: no valid option chosen)
+    latency     float32  (seconds from the question opening)
+"""
+import sys
+import threading
+from array import array
+
+from .flush import write_behind
+
+# (array typecode, numpy dtype) per column, in storage order
+COLUMNS = [
+    ('player_id', 'q', '<i8'),
+    ('question', 'H', '<u2'),
+    ('option', 'h', '<i2'),
+    ('latency', 'f', '<f4'),
+]
+
+# session id -> {column: array}
+_pending = {}
+_lock = threading.Lock()
+
+
+def _columns():
+    return {name: array(typecode) for name, typecode, _ in COLUMNS}
+
+
+def record(session_id, player_id, question_index, option, latency):
+    if type(option) is not int or not 0 <= option < 2 ** 15:
+        option = -1
+    with _lock:
+        columns = _pending.get(session_id)
+        if columns is None:
+            columns = _pending[session_id] = _columns()
+        columns['player_id'].append(player_id)
+        columns['question'].append(question_index)
+        columns['option'].append(option)
+        columns['latency'].append(latency)
+
+
+def encode(columns):
+    parts = []
+    for name, _, _ in COLUMNS:
+        column = columns[name]
+        if sys.byteorder == 'big':
+            column = array(column.typecode, column)
+            column.byteswap()
+        parts.append(column.tobytes())
+    return b''.join(parts)
+
+
+def pending_data(session_id):
+    """``(count, data)`` of the session's answers not yet flushed."""
+    with _lock:
+        columns = _pending.get(session_id)
+        if not columns:
+            return 0, b''
+        return len(columns['player_id']), encode(columns)
+
+
+def decode(count, data):
+    """The columns of ``count`` encoded answers, as arrays."""
+    columns = {}
+    offset = 0
+    for name, typecode, _ in COLUMNS:
+        column = array(typecode)
+        size = column.itemsize * count
+        column.frombytes(bytes(data[offset:offset + size]))
+        if sys.byteorder == 'big':
+            column.byteswap()
+        columns[name] = column
+        offset += size
+    return columns
+
+
+def answered_players(session_id, question_index):
+    """Ids of the players with an answer to the question, flushed or not."""
+    from .models import AnswerChunk
+
+    chunks = list(AnswerChunk.objects.filter(session_id=session_id).values_list('count', 'data'))
+    chunks.append(pending_data(session_id))
+    players = set()
+    for count, data in chunks:
+        columns = decode(count, data)
+        players.update(
+            player_id for player_id, question in zip(columns['player_id'], columns['question'])
+            if question == question_index
+        )
+    return players
+
+
+def flush_answers():
+    from .models import AnswerChunk
+
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return
+    try:
+        AnswerChunk.objects.bulk_create([
+            AnswerChunk(session_id=session_id, count=len(columns['player_id']),
+                        data=encode(columns))
+            for session_id, columns in pending.items()
+        ])
+    except Exception:
+        # Put the batch back in front of anything recorded meanwhile
+        with _lock:
+            for session_id, columns in pending.items():
+                newer = _pending.get(session_id)
+                if newer is not None:
+                    for name, column in columns.items():
+                        column.extend(newer[name])
+                _pending[session_id] = columns
+        raise
+
+
+write_behind.register(flush_answers)
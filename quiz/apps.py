@@ -3,3 +3,8 @@ from django.apps import AppConfig
 class QuizConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quiz'
+
+    def ready(self):
+        # Connects the SQLite PRAGMA setup and the metrics query counter
+        # to new connections
+        from . import db, metrics  # noqa: F401
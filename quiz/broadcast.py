@@ -0,0 +1,54 @@
+import json
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+
+def group_name(game_code):
+    return f'game_{game_code}'
+
+
+def host_group_name(game_code):
+    # Host screens only: lobby roster deltas never go to player sockets
+    return f'game_{game_code}_hosts'
+
+
+def encode_frame(message_type, **payload):
+    """Serialize a client frame once so every socket can reuse the same text."""
+    return json.dumps({'type': message_type, **payload})
+
+
+async def send_frame(game_code, text, hosts_only=False, compact=None, seq=None):
+    """Push an already-serialized frame to every socket in the game's group.
+
+    ``compact`` overrides the compact-protocol form of the frame, which is
+    otherwise derived from ``text`` by the receiving process. ``seq`` is
+    the frame's number in the game's event log, for frames that have one.
+    """
+    channel_layer = get_channel_layer()
+    group = host_group_name(game_code) if hosts_only else group_name(game_code)
+    event = {'type': 'game.frame', 'text': text}
+    if compact is not None:
+        event['compact'] = compact
+    if seq is not None:
+        event['seq'] = seq
+    await channel_layer.group_send(group, event)
+
+
+async def send_leaderboard(game_code, text, seq):
+    """Push the top-N frame; each socket follows it with its own player's rank."""
+    channel_layer = get_channel_layer()
+    await channel_layer.group_send(group_name(game_code), {
+        'type': 'game.leaderboard',
+        'text': text,
+        'seq': seq
+    })
+
+
+async def broadcast(game_code, message_type, **payload):
+    await send_frame(game_code, encode_frame(message_type, **payload))
+
+
+# Synchronous variant for the HTTP views
+def send_frame_sync(game_code, text, hosts_only=False):
+    async_to_sync(send_frame)(game_code, text, hosts_only)
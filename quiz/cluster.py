@@ -0,0 +1,219 @@
+"""Live games sharded across several server processes.
+
+With ``QUIZ_CLUSTER`` on, every process (Daphne worker) gets a random
+worker id and listens on its own channel-layer channel. The first process
+to run a command for a game claims it with a Redis lease (``SET NX PX``)
+and becomes its owner: only the owner holds the ``GameState``, runs its
+question timer and writes it back. Any other process forwards the command
+to the owner's channel and waits for the reply, so a socket may land on
+any worker while every game still has a single authority.
+
+Owners renew their leases from a heartbeat task. When a worker dies its
+leases expire, and the next command for one of its games lets another
+worker claim it and reload it from the database, which the write-behind
+keeps at most ``QUIZ_FLUSH_INTERVAL`` behind; the new owner re-arms the
+running question's timer. A worker that shuts down cleanly flushes and
+releases its leases at once.
+
+Without ``QUIZ_CLUSTER`` commands run in-process and none of this is used.
+"""
+import asyncio
+import atexit
+import logging
+import time
+import uuid
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import dispatch, flow, game_state
+from .db import db_sync_to_async
+from .flush import write_behind
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = getattr(settings, 'QUIZ_CLUSTER_LEASE', 5.0)
+# How long a process trusts its memory of another worker owning a game
+OWNER_CACHE_SECONDS = 1.0
+CALL_TIMEOUT = 5.0
+
+# Renew only if the lease is still ours; release likewise
+_RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def enabled():
+    return getattr(settings, 'QUIZ_CLUSTER', False)
+
+
+def lease_key(game_code):
+    return f'quiz:owner:{game_code}'
+
+
+def worker_channel(worker_id):
+    return f'quiz.worker.{worker_id}'
+
+
+class Cluster:
+    def __init__(self, worker_id=None, client=None):
+        self.worker_id = worker_id or uuid.uuid4().hex[:12]
+        self.channel = worker_channel(self.worker_id)
+        self._client = client
+        # Games this process owns, and recently seen owners of other games
+        self.owned = set()
+        self._owners = {}
+        self._tasks = []
+        self._loop = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis.asyncio
+            self._client = redis.asyncio.Redis.from_url(settings.REDIS_URL)
+        return self._client
+
+    def start(self):
+        # Listener and heartbeat run on the event loop of the first caller
+        # (Daphne's loop; sync views reach it through async_to_sync)
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._tasks = [
+            loop.create_task(self._serve()),
+            loop.create_task(self._heartbeat()),
+        ]
+
+    async def owner_of(self, game_code, claim=True):
+        """Worker id owning ``game_code``, claiming it when nobody does.
+
+        Returns None when the game is unowned and ``claim`` is False.
+        """
+        if game_code in self.owned:
+            return self.worker_id
+        cached = self._owners.get(game_code)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        key = lease_key(game_code)
+        if claim and await self.client.set(
+            key, self.worker_id, nx=True, px=int(LEASE_SECONDS * 1000)
+        ):
+            await self._take_over(game_code)
+            return self.worker_id
+        owner = await self.client.get(key)
+        if owner is None:
+            # Released between the two commands
+            return await self.owner_of(game_code, claim) if claim else None
+        owner = owner.decode()
+        self._owners[game_code] = (owner, time.monotonic() + OWNER_CACHE_SECONDS)
+        return owner
+
+    async def _take_over(self, game_code):
+        game = await db_sync_to_async(game_state.load_game)(game_code)
+        # Added after loading, so the heartbeat never sees a claimed game
+        # that is not in memory yet and releases it
+        self.owned.add(game_code)
+        if game is not None:
+            # Handed over mid-question: restart its timer here
+            flow.resume_deadline(game)
+
+    async def call(self, game_code, name, args):
+        self.start()
+        # Commands that would not load a game must not claim one either
+        owner = await self.owner_of(game_code, claim=dispatch.loads_game(name))
+        if owner is None:
+            return None
+        if owner == self.worker_id:
+            return await dispatch.execute(game_code, name, args)
+        layer = get_channel_layer()
+        reply_channel = await layer.new_channel()
+        await layer.send(worker_channel(owner), {
+            'type': 'game.command',
+            'game_code': game_code,
+            'name': name,
+            'args': args,
+            'reply_channel': reply_channel
+        })
+        try:
+            reply = await asyncio.wait_for(layer.receive(reply_channel), CALL_TIMEOUT)
+        except asyncio.TimeoutError:
+            # The owner is probably gone: look it up again next time
+            self._owners.pop(game_code, None)
+            logger.warning('worker %s did not answer %s for game %s', owner, name, game_code)
+            return None
+        return reply['result']
+
+    async def _serve(self):
+        layer = get_channel_layer()
+        while True:
+            message = await layer.receive(self.channel)
+            asyncio.ensure_future(self._handle(layer, message))
+
+    async def _handle(self, layer, message):
+        try:
+            # Re-routed if the lease moved while the message was in flight
+            result = await self.call(message['game_code'], message['name'], message['args'])
+        except Exception:
+            logger.exception('game command %s failed', message['name'])
+            result = None
+        await layer.send(message['reply_channel'], {'type': 'game.reply', 'result': result})
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            try:
+                await self._renew()
+            except Exception:
+                logger.exception('lease renewal failed')
+
+    async def _renew(self):
+        ttl = int(LEASE_SECONDS * 1000)
+        for game_code in list(self.owned):
+            if game_state.peek_game(game_code) is None:
+                # Finished and evicted (or never existed): let it go
+                self.owned.discard(game_code)
+                await self.client.eval(_RELEASE, 1, lease_key(game_code), self.worker_id)
+                continue
+            renewed = await self.client.eval(
+                _RENEW, 1, lease_key(game_code), self.worker_id, ttl
+            )
+            if not renewed:
+                # Another worker took over after our lease lapsed
+                logger.warning('lost game %s to another worker', game_code)
+                self.owned.discard(game_code)
+                await db_sync_to_async(game_state.drop_game)(game_code)
+
+    def release_all(self):
+        """Flush and give up every lease, for a clean shutdown."""
+        if not self.owned:
+            return
+        write_behind.flush_now()
+        import redis
+        client = redis.Redis.from_url(settings.REDIS_URL)
+        for game_code in self.owned:
+            client.eval(_RELEASE, 1, lease_key(game_code), self.worker_id)
+        self.owned.clear()
+
+
+cluster = Cluster()
+
+
+async def call(game_code, name, **args):
+    """Run game command ``name`` wherever ``game_code`` lives."""
+    if not enabled():
+        return await dispatch.execute(game_code, name, args)
+    return await cluster.call(game_code, name, args)
+
+
+if enabled():
+    atexit.register(cluster.release_all)
@@ -0,0 +1,117 @@
+"""Game code allocation without an existence check per code.
+
+Codes are the values of a database counter pushed through a keyed Feistel
+permutation of the 36^6 code space: distinct counter values always give
+distinct codes, and consecutive ones look random. Each process reserves
+a block of counter values with a single UPDATE, so handing out a code is
+normally pure arithmetic.
+"""
+import hashlib
+import string
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+BLOCK_SIZE = getattr(settings, 'QUIZ_GAME_CODE_BLOCK_SIZE', 100)
+
+_HALF_BITS = 16
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 4
+
+
+def _round_keys():
+    digest = hashlib.sha256(f'game-codes:{settings.SECRET_KEY}'.encode()).digest()
+    return [int.from_bytes(digest[i * 4:i * 4 + 4], 'big') for i in range(_ROUNDS)]
+
+
+_KEYS = _round_keys()
+
+
+def _feistel(value):
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for key in _KEYS:
+        mixed = ((right * 0x9E3779B1) ^ key) & 0xFFFFFFFF
+        mixed ^= mixed >> 15
+        left, right = right, left ^ (mixed & _HALF_MASK)
+    return (left << _HALF_BITS) | right
+
+
+def permute(index):
+    """Bijection of ``range(CODE_SPACE)`` onto itself.
+
+    The Feistel network permutes 32-bit values; cycle-walking re-applies it
+    until the result falls inside the (smaller) code space.
+    """
+    value = _feistel(index)
+    while value >= CODE_SPACE:
+        value = _feistel(value)
+    return value
+
+
+def encode(value):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def code_for_index(index):
+    return encode(permute(index % CODE_SPACE))
+
+
+def _reserve_block(size):
+    from .models import GameCodeSequence
+    with transaction.atomic():
+        updated = GameCodeSequence.objects.filter(pk=1).update(
+            next_value=F('next_value') + size
+        )
+        if not updated:
+            try:
+                with transaction.atomic():
+                    GameCodeSequence.objects.create(pk=1, next_value=size)
+                return 0
+            except IntegrityError:
+                # Another process created the row first
+                GameCodeSequence.objects.filter(pk=1).update(
+                    next_value=F('next_value') + size
+                )
+        end = GameCodeSequence.objects.values_list('next_value', flat=True).get(pk=1)
+    return end - size
+
+
+class GameCodeAllocator:
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def allocate(self, count=1):
+        codes = []
+        with self._lock:
+            while len(codes) < count:
+                if self._next >= self._end:
+                    size = max(self.block_size, count - len(codes))
+                    self._next = _reserve_block(size)
+                    self._end = self._next + size
+                take = min(count - len(codes), self._end - self._next)
+                codes.extend(code_for_index(i) for i in range(self._next, self._next + take))
+                self._next += take
+        return codes
+
+
+allocator = GameCodeAllocator()
+
+
+def allocate_game_code():
+    return allocator.allocate(1)[0]
+
+
+def allocate_game_codes(count):
+    return allocator.allocate(count)
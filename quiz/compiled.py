@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import protocol
+from .broadcast import encode_frame
+
+CACHE_SIZE = getattr(settings, 'QUIZ_COMPILED_CACHE_SIZE', 256)
+# How long a process trusts its local copy before re-reading the shared
+# cache, which bounds staleness after an edit made by another process
+LOCAL_TTL = getattr(settings, 'QUIZ_COMPILED_LOCAL_TTL', 30)
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+class CompiledQuiz:
+    """Read-only form of a quiz built once from ``Quiz.quiz_data``.
+
+    Holds the player-safe question payloads (no ``correct_answer``), the
+    answer key and the per-question points, so hot paths never walk the
+    raw JSON.
+    """
+
+    def __init__(self, quiz):
+        questions = quiz.quiz_data.get('questions', [])
+        total = len(questions)
+        self.quiz_id = quiz.id
+        self.time_per_question = quiz.time_per_question
+        self.max_players = quiz.max_players
+        self.total_questions = total
+        self.payloads = [
+            {
+                'index': index,
+                'question': question['question'],
+                'options': question['options'],
+                'time_limit': quiz.time_per_question,
+                'question_number': index + 1,
+                'total_questions': total
+            }
+            for index, question in enumerate(questions)
+        ]
+        self.correct_answers = [q.get('correct_answer') for q in questions]
+        self.points = [q.get('points', 100) for q in questions]
+        # (message type, question index) -> serialized frame, built lazily
+        self._frames = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_frames'] = {}
+        return state
+
+    def question_payload(self, index):
+        if not 0 <= index < self.total_questions:
+            return None
+        return self.payloads[index]
+
+    def question_frame(self, message_type, index):
+        # Shared by every game of this quiz and every socket in those games
+        key = (message_type, index)
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = encode_frame(message_type, question=self.question_payload(index))
+            self._frames[key] = frame
+        return frame
+
+    def packed_questions(self):
+        # Compact protocol: every question, packed once for the frames that
+        # carry the whole quiz
+        packed = self._frames.get('compact')
+        if packed is None:
+            packed = protocol.pack_questions(self)
+            self._frames['compact'] = packed
+        return packed
+
+
+_local = OrderedDict()
+_lock = threading.Lock()
+
+
+def _cache_key(quiz_id):
+    # Versioned: entries pickled by older code lack newer attributes
+    return f'quiz:compiled:v2:{quiz_id}'
+
+
+def _remember(compiled):
+    with _lock:
+        _local[compiled.quiz_id] = (time.monotonic() + LOCAL_TTL, compiled)
+        _local.move_to_end(compiled.quiz_id)
+        while len(_local) > CACHE_SIZE:
+            _local.popitem(last=False)
+
+
+def store_compiled_quiz(quiz):
+    """Compile ``quiz`` and publish it to both cache tiers. Called from ``Quiz.save``."""
+    compiled = CompiledQuiz(quiz)
+    cache.set(_cache_key(quiz.id), compiled, CACHE_TIMEOUT)
+    _remember(compiled)
+    return compiled
+
+
+def invalidate_compiled_quiz(quiz_id):
+    with _lock:
+        _local.pop(quiz_id, None)
+    cache.delete(_cache_key(quiz_id))
+
+
+def get_compiled_quiz(quiz_id):
+    """Return the compiled quiz: process LRU, then Django cache, then the DB.
+
+    Returns None if the quiz does not exist.
+    """
+    with _lock:
+        entry = _local.get(quiz_id)
+        if entry is not None:
+            expires, compiled = entry
+            if expires > time.monotonic():
+                _local.move_to_end(quiz_id)
+                return compiled
+    compiled = cache.get(_cache_key(quiz_id))
+    if compiled is not None:
+        _remember(compiled)
+        return compiled
+
+    from .models import Quiz
+    quiz = Quiz.objects.filter(id=quiz_id).only(
+        'id', 'quiz_data', 'time_per_question', 'max_players'
+    ).first()
+    if quiz is None:
+        return None
+    return store_compiled_quiz(quiz)
@@ -1,122 +1,261 @@
+import asyncio
 import json
+import time
+from collections import deque
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from .models import Quiz, GameSession, Player
+from django.conf import settings
+from . import metrics, protocol, tokens
+from .broadcast import group_name, host_group_name
+from .cluster import call
+from .db import db_sync_to_async
+
+# Logged frames a socket may have sent but not seen acknowledged before it
+# is dropped. The ASGI server buffers writes without ever making send()
+# wait, so the client's own acks are the only sign that it is keeping up.
+MAX_UNACKED = getattr(settings, 'QUIZ_SOCKET_MAX_UNACKED', 32)
+# Close code for those sockets; clients reconnect and resume (see events.py)
+CLOSE_TOO_SLOW = 4008
+# Message types receive() handles; the only ones used as metric labels, so
+# clients cannot add series to /metrics
+MESSAGE_TYPES = frozenset([
+    'start_game', 'next_question', 'end_game', 'player_joined', 'submit_answer',
+    'roster_subscribe', 'resume', 'get_quiz', 'ack',
+])
+
+
+# Seconds a fetched ranking is kept for sockets still getting its leaderboard
+RANKING_TTL = 10
+
+# (game code, leaderboard frame) -> task fetching that game's ranking; the
+# frame carries its seq, so each leaderboard gets exactly one fetch here
+_rankings = {}
+
+
+def shared_ranking(game_code, frame):
+    key = (game_code, frame)
+    task = _rankings.get(key)
+    if task is None:
+        task = _rankings[key] = asyncio.ensure_future(fetch_ranking(game_code))
+        asyncio.get_running_loop().call_later(RANKING_TTL, _rankings.pop, key, None)
+    return task
+
+
+async def fetch_ranking(game_code):
+    """``({player_id: (rank, score)}, total_players)``, or None."""
+    result = await call(game_code, 'ranking')
+    if result is None:
+        return None
+    ranks = {
+        player_id: (rank, score)
+        for rank, (player_id, score) in enumerate(result['ranking'], 1)
+    }
+    return ranks, result['total_players']
+
+
+class GameConsumer(metrics.MetricsConsumerMixin, AsyncWebsocketConsumer):
+    # Game commands go through cluster.call: they run here when this
+    # process owns the game and on the owning worker otherwise
 
-class GameConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        await self.accept()
-    
+        self.game_code = self.scope['url_route']['kwargs']['game_code']
+        self.group_name = group_name(self.game_code)
+        # A player token for this game names the player without a session read
+        token = tokens.from_scope(self.scope)
+        if token is not None and token.game_code == self.game_code:
+            self.player_id = token.player_id
+        else:
+            self.player_id = None
+        self.in_lobby = False
+        self.roster_subscribed = False
+        # Opt-in compact protocol (see protocol.py), negotiated per socket
+        self.compact = protocol.SUBPROTOCOL in self.scope.get('subprotocols', [])
+        # Seqs of logged frames sent since the client's last ack; None until
+        # it acks at all, so clients that never ack are not tracked
+        self.unacked = None
+        self.dropped = False
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept(subprotocol=protocol.SUBPROTOCOL if self.compact else None)
+
     async def disconnect(self, close_code):
-        pass
-    
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        message_type = data['type']
-        
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if self.roster_subscribed:
+            await self.channel_layer.group_discard(
+                host_group_name(self.game_code), self.channel_name
+            )
+        if self.in_lobby:
+            await call(self.game_code, 'player_left', player_id=self.player_id)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if self.dropped:
+            return
+        await super().send(text_data, bytes_data, close)
+
+    async def track(self, seq):
+        """Count a logged frame as unacknowledged; False if that drops the socket."""
+        if self.unacked is None or seq is None:
+            return True
+        if len(self.unacked) >= MAX_UNACKED:
+            self.dropped = True
+            metrics.ws_dropped.inc()
+            await self.close(code=CLOSE_TOO_SLOW)
+            return False
+        self.unacked.append(seq)
+        return True
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Server receive time, used to time answers
+        received_at = time.time()
+        if bytes_data is not None:
+            data = protocol.decode(bytes_data)
+            if data is None:
+                return
+        else:
+            data = json.loads(text_data)
+        message_type = data.get('type') if isinstance(data, dict) else None
+        # Anything else is ignored, and measured as 'unknown'
+        if not isinstance(message_type, str) or message_type not in MESSAGE_TYPES:
+            return
+        metrics.set_label(message_type)
+
         if message_type == 'start_game':
-            await self.start_game()
+            await call(self.game_code, 'start_game')
         elif message_type == 'next_question':
-            await self.next_question()
+            # The host says which question it is closing, so a click that
+            # crosses the timer's auto-advance doesn't skip a question
+            await call(self.game_code, 'next_question', question_index=data.get('question_index'))
         elif message_type == 'end_game':
-            await self.end_game()
+            await call(self.game_code, 'end_game')
         elif message_type == 'player_joined':
             await self.player_joined(data)
-    
-    async def start_game(self):
-        await self.update_game_status('ACTIVE')
-        # Channels group_send removed
-    
-    async def next_question(self):
-        question_data = await self.advance_question()
-        # Channels group_send removed
-        if not question_data:
-            await self.end_game()
-    
-    async def end_game(self):
-        await self.update_game_status('FINISHED')
-        # Channels group_send removed
-    
+        elif message_type == 'submit_answer':
+            await self.submit_answer(data, received_at)
+        elif message_type == 'roster_subscribe':
+            await self.roster_subscribe()
+        elif message_type == 'resume':
+            await self.resume(data)
+        elif message_type == 'ack':
+            self.ack(data)
+        elif message_type == 'get_quiz' and self.compact:
+            result = await call(self.game_code, 'quiz')
+            if result is not None:
+                await self.send(bytes_data=result['compact'])
+
+    async def send_result(self, frame):
+        # A reply meant for this socket only
+        if self.compact:
+            await self.send(bytes_data=protocol.encode(frame))
+        else:
+            await self.send(text_data=json.dumps(frame))
+
+    async def send_shared(self, text, compact=None):
+        # A frame shared by many sockets, already serialized as JSON
+        if self.compact:
+            await self.send(bytes_data=compact or protocol.convert(text))
+        else:
+            await self.send(text_data=text)
+
     async def player_joined(self, data):
-        pass
-    
-    # WebSocket message handlers
-    async def game_started(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'game_started',
-            'question': event['question']
-        }))
-    
-    async def new_question(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'new_question',
-            'question': event['question']
-        }))
-    
-    async def game_ended(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'game_ended'
-        }))
-    
-    async def player_update(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'player_update',
-            'player': event['player']
-        }))
-    
-    
-    # removed stray decorator
-    def update_game_status(self, status):
-        try:
-            session = GameSession.objects.get(quiz__game_code=self.game_code)
-            session.status = status
-            session.save()
-        except GameSession.DoesNotExist:
-            pass
-    
-    # removed stray decorator
-    def get_current_question(self):
-        try:
-            session = GameSession.objects.get(quiz__game_code=self.game_code)
-            quiz_data = session.quiz.quiz_data
-            questions = quiz_data['questions']
-            
-            if session.current_question_index < len(questions):
-                question = questions[session.current_question_index]
-                return {
-                    'index': session.current_question_index,
-                    'question': question['question'],
-                    'options': question['options'],
-                    'time_limit': session.quiz.time_per_question,
-                    'question_number': session.current_question_index + 1,
-                    'total_questions': len(questions)
-                }
-            return None
-        except GameSession.DoesNotExist:
-            return None
-    
-    # removed stray decorator
-    def advance_question(self):
-        try:
-            session = GameSession.objects.get(quiz__game_code=self.game_code)
-            session.current_question_index += 1
-            session.save()
-            
-            quiz_data = session.quiz.quiz_data
-            questions = quiz_data['questions']
-            
-            if session.current_question_index < len(questions):
-                question = questions[session.current_question_index]
-                return {
-                    'index': session.current_question_index,
-                    'question': question['question'],
-                    'options': question['options'],
-                    'time_limit': session.quiz.time_per_question,
-                    'question_number': session.current_question_index + 1,
-                    'total_questions': len(questions)
-                }
-            return None
-        except GameSession.DoesNotExist:
-            return None
-    
-    # removed stray decorator
+        # A player page announcing itself: it stays in the lobby roster
+        # until this socket closes
+        if self.player_id is None:
+            self.player_id = await self.get_session_player_id()
+        if not self.player_id:
+            return
+        await call(self.game_code, 'player_joined', player_id=self.player_id)
+        self.in_lobby = True
+
+    async def roster_subscribe(self):
+        # Host screens get one snapshot, then only incremental roster deltas
+        snapshot = await call(self.game_code, 'roster')
+        if snapshot is None:
+            return
+        if not self.roster_subscribed:
+            await self.channel_layer.group_add(
+                host_group_name(self.game_code), self.channel_name
+            )
+            self.roster_subscribed = True
+        del snapshot['etag']
+        await self.send_result(snapshot)
+
+    def ack(self, data):
+        # The client has handled every logged frame up to this seq
+        seq = data.get('seq')
+        if not isinstance(seq, int):
+            return
+        if self.unacked is None:
+            self.unacked = deque()
+        while self.unacked and self.unacked[0] <= seq:
+            self.unacked.popleft()
+
+    async def resume(self, data):
+        # A reconnecting socket names the last frame it saw and gets only
+        # what it missed, so a Wi-Fi blip costs a few frames, not a reload
+        since = data.get('seq')
+        if not isinstance(since, int):
+            return
+        # Replayed frames are not tracked; the client acks afresh
+        self.unacked = None
+        if self.player_id is None:
+            self.player_id = await self.get_session_player_id()
+        result = await call(self.game_code, 'resume', since=since, player_id=self.player_id)
+        if result is None:
+            return
+        if result['type'] == 'snapshot':
+            await self.send_result(result)
+            return
+        for text, compact in result['events']:
+            await self.send_shared(text, compact)
+
+    async def submit_answer(self, data, received_at):
+        # Same ingest path as the HTTP endpoint, without the extra request
+        if self.player_id is None:
+            self.player_id = await self.get_session_player_id()
+        if not self.player_id:
+            await self.send_result({
+                'type': 'answer_result',
+                'error': 'Not authenticated'
+            })
+            return
+        result = await call(
+            self.game_code,
+            'submit_answer',
+            player_id=self.player_id,
+            question_index=data.get('question_index'),
+            selected_answer=data.get('selected_answer'),
+            received_at=received_at
+        )
+        if result is None:
+            result = {'type': 'answer_result', 'error': 'Invalid question'}
+        await self.send_result(result)
+
+    # Group message handler: frames arrive pre-serialized, so fan-out
+    # costs one send per socket and no per-socket json.dumps
+    async def game_frame(self, event):
+        if await self.track(event.get('seq')):
+            await self.send_shared(event['text'], event.get('compact'))
+
+    async def game_leaderboard(self, event):
+        # Shared top-N frame, then this player's own rank, looked up in the
+        # ranking this process fetched once for all of its sockets
+        if not await self.track(event.get('seq')):
+            return
+        await self.send_shared(event['text'])
+        if not self.player_id:
+            return
+        ranking = await shared_ranking(self.game_code, event['text'])
+        if ranking is None:
+            return
+        ranks, total_players = ranking
+        entry = ranks.get(self.player_id)
+        if entry is not None:
+            await self.send_result({
+                'type': 'my_rank',
+                'rank': entry[0],
+                'score': entry[1],
+                'total_players': total_players
+            })
+
+    @db_sync_to_async
+    def get_session_player_id(self):
+        session = self.scope.get('session')
+        return session.get('player_id') if session is not None else None
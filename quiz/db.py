@@ -0,0 +1,81 @@
+"""Database access for the game engine.
+
+Everything the game engine does with the ORM (game loads from the socket
+consumers, write-behind flushes) runs on one fixed pool of
+``QUIZ_DB_THREADS`` threads. The threads live as long as the process and
+keep their connections between calls, so the pool doubles as a
+connection pool of the same size, whatever ``CONN_MAX_AGE`` the
+per-request threads of ASGI views use.
+
+The SQLite profile sizes the pool to one thread: the engine's writes are
+queued and applied by a single writer instead of fighting over the
+database file lock.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import SyncToAsync
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+POOL_SIZE = getattr(settings, 'QUIZ_DB_THREADS', 1)
+
+executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix='quiz-db')
+
+
+def release_connections():
+    # Keep this pool thread's connections open for the next call; only a
+    # broken one, or one left in a transaction, is dropped
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is not None:
+            connection.close_at = None
+            connection.close_if_unusable_or_obsolete()
+
+
+class PooledSyncToAsync(SyncToAsync):
+    def __init__(self, func):
+        super().__init__(func, thread_sensitive=False, executor=executor)
+
+    def thread_handler(self, loop, *args, **kwargs):
+        try:
+            return super().thread_handler(loop, *args, **kwargs)
+        finally:
+            release_connections()
+
+
+# Drop-in replacement for channels' database_sync_to_async
+db_sync_to_async = PooledSyncToAsync
+
+
+def run_in_pool(func):
+    """Run ``func`` on the pool from a plain thread and wait for it."""
+    def call():
+        try:
+            return func()
+        finally:
+            release_connections()
+    return executor.submit(call).result()
+
+
+def on_pool_threads(func):
+    """Run ``func`` once on every pool thread and wait for all of them."""
+    # The barrier keeps each job on its own thread
+    barrier = threading.Barrier(POOL_SIZE)
+
+    def job():
+        barrier.wait()
+        func()
+    for future in [executor.submit(job) for _ in range(POOL_SIZE)]:
+        future.result()
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'QUIZ_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,157 @@
+"""Game commands, run by the process that holds the game.
+
+Sockets and HTTP views never touch a ``GameState`` directly; they go
+through ``cluster.call``, which runs the command here when this process
+owns the game and forwards it to the owner otherwise. Each handler gets
+the live game plus the command's arguments and returns a frame (a dict
+with a ``type``) for the caller, or None.
+"""
+import time
+
+from . import flow, game_state, ingest
+from .broadcast import send_frame
+from .db import db_sync_to_async
+
+_handlers = {}
+
+
+def command(name, load=True):
+    """Register a handler; ``load=False`` ones only act on a game already live."""
+    def register(func):
+        _handlers[name] = (func, load)
+        return func
+    return register
+
+
+def loads_game(name):
+    return _handlers[name][1]
+
+
+async def execute(game_code, name, args):
+    func, load = _handlers[name]
+    game = game_state.peek_game(game_code)
+    if game is None and load:
+        game = await db_sync_to_async(game_state.load_game)(game_code)
+    if game is None:
+        return None
+    game.last_command_at = time.monotonic()
+    # Also covers games loaded as a side effect, by game_for_player
+    flow.resume_deadline(game)
+    return await func(game, **args)
+
+
+@command('start_game')
+async def start_game(game):
+    await flow.start_game(game)
+
+
+@command('next_question')
+async def next_question(game, question_index=None):
+    await flow.next_question(game, question_index)
+
+
+@command('end_game')
+async def end_game(game):
+    await flow.end_game(game)
+
+
+@command('player_joined')
+async def player_joined(game, player_id):
+    known, delta = game.readmit_player(player_id)
+    if not known:
+        # game_for_player adds the player and notifies the hosts itself
+        await db_sync_to_async(game_state.game_for_player)(player_id)
+    elif delta:
+        await send_frame(game.game_code, delta, hosts_only=True)
+
+
+@command('join')
+async def join(game, player_name):
+    # Admission runs on the owner, so max_players holds across workers
+    if game.status == 'FINISHED':
+        return {'type': 'join_result', 'error': 'Game has ended'}
+    if not game.reserve_seat():
+        return {'type': 'join_result', 'error': 'Game is full'}
+    try:
+        player = await db_sync_to_async(game_state.create_player)(game, player_name)
+        if player is None:
+            return {'type': 'join_result', 'error': 'Name is already taken'}
+        delta = game.add_player(player.id, player.name, joined_at=player.joined_at)
+    finally:
+        game.release_seat()
+    if delta:
+        await send_frame(game.game_code, delta, hosts_only=True)
+    return {'type': 'join_result', 'player_id': player.id, 'session_id': game.session_id}
+
+
+@command('player_left', load=False)
+async def player_left(game, player_id):
+    delta = game.remove_player(player_id)
+    if delta:
+        await send_frame(game.game_code, delta, hosts_only=True)
+
+
+@command('submit_answer')
+async def submit_answer(game, player_id, question_index, selected_answer, received_at):
+    if player_id not in game.scores:
+        await db_sync_to_async(game_state.game_for_player)(player_id)
+        if player_id not in game.scores:
+            return {'type': 'answer_result', 'error': 'Player not found'}
+    result = ingest.submit_answer(
+        game, player_id, question_index, selected_answer, received_at
+    )
+    if result is None:
+        result = {'error': 'Invalid question'}
+    elif 'error' not in result:
+        await flow.answer_recorded(game)
+    return {'type': 'answer_result', **result}
+
+
+@command('roster')
+async def roster(game, since=None):
+    data = game.roster_since(since) if since is not None else None
+    if data is None:
+        data = game.roster_snapshot()
+    return {
+        'type': 'roster_snapshot',
+        'etag': f'W/"roster-{game.session_id}-{game.roster_epoch}-{game.roster_version}"',
+        **data
+    }
+
+
+@command('ranking', load=False)
+async def ranking(game):
+    # The whole ranking in one reply: a worker asks once per leaderboard
+    # for all its sockets, not once per socket
+    return {
+        'type': 'ranking',
+        'ranking': game.leaderboard.top(len(game.leaderboard)),
+        'total_players': len(game.leaderboard)
+    }
+
+
+@command('leaderboard')
+async def leaderboard(game, limit, player_id=None):
+    return {
+        'type': 'leaderboard',
+        'top': game.leaderboard_top(limit),
+        'total_players': len(game.leaderboard),
+        'me': game.player_rank(player_id) if player_id is not None else None
+    }
+
+
+@command('quiz')
+async def quiz(game):
+    # Compact protocol: the whole quiz for a socket that missed game_started
+    index = game.current_question_index if game.status == 'ACTIVE' else None
+    return {'type': 'quiz', 'compact': game.compact_frame('quiz', game.events.seq, index)}
+
+
+@command('resume')
+async def resume(game, since, player_id=None):
+    # The frames a reconnecting socket missed, or a snapshot when the log
+    # no longer reaches back to ``since``
+    missed = game.events.since(since)
+    if missed is None:
+        return game.snapshot(player_id)
+    return {'type': 'events', 'events': missed}
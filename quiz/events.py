@@ -0,0 +1,132 @@
+"""Per-game event log for socket resume.
+
+Every frame broadcast to a whole game (question changes, leaderboards,
+game end) is stamped with a sequence number and kept in a bounded log on
+the process that owns the game. A socket that reconnects sends the last
+``seq`` it saw and gets only the frames it missed; one that is too far
+behind gets a snapshot of the game instead.
+
+With Redis available the log is mirrored into a capped stream, written by
+the write-behind thread like the leaderboard mirror, so a worker that
+takes a game over after a crash can replay what the old owner flushed.
+Frames it numbered after its last flush are lost with it: the new owner
+skips ahead of them, and a socket holding one of their seqs gets a
+snapshot.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+
+from .flush import write_behind
+from .leaderboard import redis_client, redis_enabled
+
+EVENT_LOG_SIZE = getattr(settings, 'QUIZ_EVENT_LOG_SIZE', 256)
+STREAM_TTL = 24 * 60 * 60
+# Seqs skipped after a restore, more than a previous owner can number
+# between two flushes
+RESTORE_GAP = 1_000_000
+
+# stream key -> [(seq, text, compact), ...] waiting for the next flush
+_pending = defaultdict(list)
+_pending_lock = threading.Lock()
+
+
+def stream_enabled():
+    return redis_enabled() or getattr(settings, 'QUIZ_CLUSTER', False)
+
+
+def stamp(text, seq):
+    # Frames are serialized once and shared; splicing the number in front
+    # avoids decoding and re-encoding them
+    return f'{{"seq": {seq}, {text[1:]}'
+
+
+class EventLog:
+    """Bounded log of a game's broadcast frames, numbered from ``seq``."""
+
+    def __init__(self, session_id, size=EVENT_LOG_SIZE):
+        self.key = f'quiz:events:{session_id}'
+        self.entries = deque(maxlen=size)
+        # A log that starts empty starts numbering at the clock, so a seq
+        # from a previous owner's log can never be mistaken for this one's
+        self.seq = int(time.time() * 1000)
+        self.backed = stream_enabled()
+        # (last restored seq, first seq of this log) after a restore
+        self.gap = None
+        self.lock = threading.Lock()
+
+    def restore(self):
+        """Reload the retained frames from Redis. Synchronous."""
+        rows = redis_client().xrevrange(self.key, count=self.entries.maxlen)
+        if not rows:
+            return
+        with self.lock:
+            for _, fields in reversed(rows):
+                seq = int(fields[b'seq'])
+                self.entries.append((seq, fields[b'text'].decode(), fields[b'compact'] or None))
+            last = self.entries[-1][0]
+            # Never reuse a seq the old owner sent but did not flush
+            self.seq = max(self.seq, last) + RESTORE_GAP
+            self.gap = (last, self.seq)
+
+    def append(self, text, compact=None):
+        """Number a frame and keep it.
+
+        ``compact`` is a function of the seq building the frame's compact
+        form, for frames that cannot be derived from the text. Returns the
+        seq, the stamped text and the compact frame.
+        """
+        with self.lock:
+            self.seq += 1
+            seq = self.seq
+            text = stamp(text, seq)
+            if compact is not None:
+                compact = compact(seq)
+            self.entries.append((seq, text, compact))
+        if self.backed:
+            with _pending_lock:
+                _pending[self.key].append((seq, text, compact))
+        return seq, text, compact
+
+    def since(self, seq):
+        """Frames after ``seq`` as ``[text, compact]`` pairs.
+
+        Returns None when ``seq`` is older than the retained log or not
+        from this log at all; the caller sends a snapshot instead.
+        """
+        with self.lock:
+            if seq == self.seq:
+                return []
+            if seq > self.seq or not self.entries or seq < self.entries[0][0] - 1:
+                return None
+            if self.gap is not None and self.gap[0] < seq < self.gap[1]:
+                # From frames the old owner never flushed
+                return None
+            return [[text, compact] for entry_seq, text, compact in self.entries
+                    if entry_seq > seq]
+
+
+def flush_event_logs():
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return
+    pipe = redis_client().pipeline(transaction=False)
+    for key, entries in pending.items():
+        for seq, text, compact in entries:
+            pipe.xadd(key, {'seq': seq, 'text': text, 'compact': compact or b''},
+                      maxlen=EVENT_LOG_SIZE, approximate=True)
+        pipe.expire(key, STREAM_TTL)
+    try:
+        pipe.execute()
+    except Exception:
+        with _pending_lock:
+            for key, entries in pending.items():
+                _pending[key][:0] = entries
+        raise
+
+
+write_behind.register(flush_event_logs)
@@ -0,0 +1,145 @@
+"""Game transitions shared by the socket consumer and the HTTP host controls.
+
+Every question that opens gets a deadline on the process timer wheel; when
+it expires the game moves on through ``next_question`` exactly as if the
+host had clicked. A short reveal pause after the deadline leaves players
+time to see whether they were right.
+
+While a question is open the host screens get its answer distribution,
+coalesced: at most ``QUIZ_DISTRIBUTION_RATE`` snapshots a second however
+many answers arrive, and a final one when the question closes.
+"""
+import time
+
+from django.conf import settings
+
+from . import game_state
+from .broadcast import encode_frame, send_frame, send_leaderboard
+from .timers import wheel
+
+AUTO_ADVANCE = getattr(settings, 'QUIZ_AUTO_ADVANCE', True)
+REVEAL_SECONDS = getattr(settings, 'QUIZ_REVEAL_SECONDS', 2.0)
+DISTRIBUTION_INTERVAL = 1 / getattr(settings, 'QUIZ_DISTRIBUTION_RATE', 4)
+
+
+def schedule_deadline(game):
+    game.deadline_armed = True
+    if AUTO_ADVANCE and game.question_deadline is not None:
+        # The deadline is wall-clock time; the wheel runs on the monotonic clock
+        remaining = game.question_deadline + REVEAL_SECONDS - time.time()
+        wheel.schedule(
+            game.game_code,
+            time.monotonic() + remaining,
+            question_expired,
+            game.game_code,
+            game.current_question_index
+        )
+
+
+def resume_deadline(game):
+    """Arm the open question's deadline of a game reloaded mid-question.
+
+    A game loaded from the database (after a restart, or handed over by
+    another worker) lost its timer with the process that ran it.
+    """
+    if not game.deadline_armed and game.status == 'ACTIVE' and game.closed_index is None:
+        schedule_deadline(game)
+
+
+async def question_expired(game_code, question_index):
+    game = game_state.peek_game(game_code)
+    if game is not None:
+        await next_question(game, question_index)
+
+
+def distribution_key(game_code):
+    # Its own wheel entry, next to the game's question deadline
+    return f'{game_code}:distribution'
+
+
+async def answer_recorded(game):
+    """Push the answer distribution to the hosts, throttled.
+
+    The first answer after a quiet spell goes out at once; answers within
+    ``DISTRIBUTION_INTERVAL`` of the last push are folded into one more
+    snapshot sent when the interval is over.
+    """
+    if game.distribution_pending:
+        return
+    due = game.distribution_sent_at + DISTRIBUTION_INTERVAL
+    if time.monotonic() >= due:
+        await send_distribution(game)
+        return
+    game.distribution_pending = True
+    wheel.schedule(distribution_key(game.game_code), due, distribution_due, game.game_code)
+
+
+async def distribution_due(game_code):
+    game = game_state.peek_game(game_code)
+    if game is not None and game.distribution_pending:
+        await send_distribution(game)
+
+
+async def send_distribution(game, final=False):
+    game.distribution_pending = False
+    game.distribution_sent_at = time.monotonic()
+    await send_frame(game.game_code, game.distribution_frame(final), hosts_only=True)
+
+
+async def close_distribution(game):
+    # The closing snapshot always goes out, with whatever was coalesced
+    wheel.cancel(distribution_key(game.game_code))
+    await send_distribution(game, final=True)
+
+
+async def publish(game, text, compact=None):
+    # Game-wide frames are numbered and logged so reconnecting sockets can
+    # replay what they missed
+    seq, text, compact = game.events.append(text, compact)
+    await send_frame(game.game_code, text, compact=compact, seq=seq)
+
+
+async def publish_leaderboard(game):
+    seq, text, _ = game.events.append(game.leaderboard_frame())
+    await send_leaderboard(game.game_code, text, seq)
+
+
+async def start_game(game):
+    if game.start():
+        schedule_deadline(game)
+        await publish(
+            game,
+            game.question_frame('game_started', 0),
+            compact=lambda seq: game.compact_frame('game_started', seq, 0)
+        )
+
+
+async def next_question(game, question_index=None):
+    if question_index is None:
+        question_index = game.current_question_index
+    # Only the first of the host and the timer closes a question
+    if not game.close_question(question_index):
+        return
+    wheel.cancel(game.game_code)
+    await close_distribution(game)
+    # Close the current question with a ranking before showing the next one
+    await publish_leaderboard(game)
+    question_data = game.advance()
+    if not question_data:
+        await end_game(game, leaderboard_sent=True)
+        return
+    schedule_deadline(game)
+    await publish(game, game.question_frame('new_question', question_data['index']))
+
+
+async def end_game(game, leaderboard_sent=False):
+    wheel.cancel(game.game_code)
+    # Ended by the host with a question still open; after the last
+    # question the index has run past the quiz and nothing is open
+    index = game.current_question_index
+    if index < game.total_questions and game.close_question(index):
+        await close_distribution(game)
+    game.finish()
+    if not leaderboard_sent:
+        await publish_leaderboard(game)
+    await publish(game, encode_frame('game_ended'))
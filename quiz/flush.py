@@ -0,0 +1,66 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+
+from .db import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehind:
+    """Background thread that periodically runs registered flush callbacks.
+
+    Hot paths record their changes in memory and leave persistence to this
+    thread, so a burst of game messages turns into one batched write per
+    interval instead of one write per message.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._callbacks = []
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def register(self, callback):
+        if callback not in self._callbacks:
+            self._callbacks.append(callback)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='quiz-write-behind', daemon=True
+                )
+                self._thread.start()
+
+    def wake(self):
+        # Ask for a flush on the next loop iteration without blocking the caller
+        self._wakeup.set()
+
+    def flush_now(self):
+        # Serialized so a manual flush never races the background one
+        with self._flush_lock:
+            for callback in self._callbacks:
+                callback()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                # On the engine's database pool: with SQLite that makes
+                # the flush just another job for the single writer
+                run_in_pool(self.flush_now)
+            except Exception:
+                # Keep the thread alive; the dirty state is retried next tick
+                logger.exception('write-behind flush failed')
+
+
+write_behind = WriteBehind(getattr(settings, 'QUIZ_FLUSH_INTERVAL', 1.0))
+atexit.register(write_behind.flush_now)
@@ -0,0 +1,557 @@
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .broadcast import encode_frame, send_frame_sync
+from . import answers, protocol
+from .compiled import get_compiled_quiz
+from .events import EventLog
+from .flush import write_behind
+from .leaderboard import RedisLeaderboard, SkipListLeaderboard, redis_enabled
+from .ratelimit import (
+    GAME_BURST, GAME_RATE, PLAYER_BURST, PLAYER_RATE, AnswerBitmap, TokenBucket
+)
+from .models import GameSession, Player
+
+# Roster changes kept for hosts and pollers that ask for a delta
+ROSTER_LOG_SIZE = 200
+# Entries in the leaderboard broadcast after each question
+LEADERBOARD_SIZE = 10
+# Answers received this long after the deadline still count, to absorb
+# network latency between the player's countdown and the server
+ANSWER_GRACE = getattr(settings, 'QUIZ_ANSWER_GRACE', 1.0)
+# Games that got no command for this many seconds leave memory at the next
+# flush (a lobby nobody started, a game its host walked away from)
+IDLE_SECONDS = getattr(settings, 'QUIZ_IDLE_GAME_SECONDS', 30 * 60)
+
+
+def roster_entry(player_id, name, joined_at=None):
+    return {
+        'id': player_id,
+        'name': name,
+        'joined_at': joined_at.strftime('%H:%M') if joined_at else ''
+    }
+
+
+class GameState:
+    """Authoritative in-memory state of one live game.
+
+    Questions and the answer key come from the compiled quiz cache; every
+    read and mutation is served from memory and persisted to ``GameSession``
+    in batches by the write-behind thread.
+    """
+
+    def __init__(self, session, quiz, players):
+        self.game_code = session.game_code
+        self.session_id = session.id
+        self.quiz_id = quiz.quiz_id
+        # Compiled quiz: payloads, answer key and points, shared across games
+        self.quiz = quiz
+        self.time_per_question = quiz.time_per_question
+        self.max_players = quiz.max_players
+        self.correct_answers = quiz.correct_answers
+        self.points = quiz.points
+        self.status = session.status
+        self.current_question_index = session.current_question_index
+        self.started_at = session.started_at
+        self.ended_at = session.ended_at
+        # Server clock (epoch seconds, comparable across worker processes)
+        # of the open question; answers are timed against it, never against
+        # what the client reports
+        self.question_opened_at = None
+        self.closed_index = None
+        # Set once flow has scheduled a question deadline for this game
+        self.deadline_armed = False
+        # Monotonic time of the last command, for idle eviction
+        self.last_command_at = time.monotonic()
+        if self.status == 'ACTIVE':
+            # Reloaded mid-question: reopen it with a fresh clock
+            self.question_opened_at = time.time()
+        # Lobby roster in join order (player id -> entry) and scores
+        self.players = {}
+        self.scores = {}
+        for player_id, name, score, joined_at in players:
+            self.players[player_id] = roster_entry(player_id, name, joined_at)
+            self.scores[player_id] = score
+        self.leaderboard = SkipListLeaderboard(self.scores.items())
+        self.redis_leaderboard = None
+        if redis_enabled():
+            self.redis_leaderboard = RedisLeaderboard(self.session_id)
+            for player_id, score in self.scores.items():
+                self.redis_leaderboard.set(player_id, score)
+        # Players whose socket left the lobby, kept so they can rejoin cheaply
+        self.departed = {}
+        # Seats held by joins whose Player row is being inserted
+        self.reserved_seats = 0
+        # Answer gates: scored (player, question) pairs and rate limits
+        self.answered = AnswerBitmap(quiz.total_questions)
+        self.answer_buckets = {}
+        self.game_bucket = TokenBucket(GAME_RATE, GAME_BURST, time.monotonic())
+        # Answers per option to the open question, for the host screens;
+        # flow.answer_recorded throttles how often they are pushed
+        self.option_counts = []
+        self.answer_count = 0
+        self.distribution_sent_at = 0.0
+        self.distribution_pending = False
+        if self.status == 'ACTIVE':
+            self._reset_distribution(self.current_question_index)
+        # Distinguishes roster versions across reloads of the same session
+        self.roster_epoch = int(time.time() * 1000)
+        self.roster_version = 0
+        self.roster_log = deque(maxlen=ROSTER_LOG_SIZE)
+        # Numbered broadcast frames, replayed to sockets that reconnect
+        self.events = EventLog(self.session_id)
+        if self.events.backed:
+            self.events.restore()
+        self.lock = threading.Lock()
+
+    @property
+    def total_questions(self):
+        return self.quiz.total_questions
+
+    def question_payload(self, index=None):
+        if index is None:
+            index = self.current_question_index
+        return self.quiz.question_payload(index)
+
+    def question_frame(self, message_type, index):
+        return self.quiz.question_frame(message_type, index)
+
+    def compact_frame(self, message_type, seq, index):
+        return protocol.quiz_frame(message_type, seq, index, self.quiz)
+
+    def start(self):
+        """Open question 0; None unless the game is still WAITING.
+
+        A second start (another host tab, a double click) must not rewind a
+        running or finished game.
+        """
+        with self.lock:
+            if self.status != 'WAITING':
+                return None
+            self.status = 'ACTIVE'
+            self.current_question_index = 0
+            self.started_at = timezone.now()
+            self.question_opened_at = time.time()
+            self.closed_index = None
+            self._reset_distribution(0)
+        mark_dirty(self)
+        return self.question_payload(0)
+
+    def advance(self):
+        with self.lock:
+            self.current_question_index += 1
+            index = self.current_question_index
+            self.question_opened_at = time.time()
+            self._reset_distribution(index)
+        mark_dirty(self)
+        return self.question_payload(index)
+
+    @property
+    def question_deadline(self):
+        if self.question_opened_at is None:
+            return None
+        return self.question_opened_at + self.time_per_question
+
+    def close_question(self, index):
+        """Stop taking answers for question ``index``.
+
+        Returns False when that question is not the open one (already
+        closed, by the host or by its timer, or the game is not running),
+        so only one caller moves the game on.
+        """
+        with self.lock:
+            if (self.status != 'ACTIVE' or index != self.current_question_index
+                    or self.closed_index == index):
+                return False
+            self.closed_index = index
+            return True
+
+    def response_time(self, index, received_at):
+        """Seconds between the question opening and ``received_at``.
+
+        None when ``index`` is not the open question or the answer arrived
+        after the deadline (plus ``ANSWER_GRACE``).
+        """
+        with self.lock:
+            if (self.status != 'ACTIVE' or index != self.current_question_index
+                    or self.closed_index == index or self.question_opened_at is None):
+                return None
+            elapsed = received_at - self.question_opened_at
+        if elapsed > self.time_per_question + ANSWER_GRACE:
+            return None
+        return min(max(elapsed, 0.0), self.time_per_question)
+
+    def allow_answer(self, player_id):
+        """Take a token from the player's and the game's answer buckets."""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.answer_buckets.get(player_id)
+            if bucket is None:
+                bucket = self.answer_buckets[player_id] = TokenBucket(
+                    PLAYER_RATE, PLAYER_BURST, now
+                )
+            return bucket.take(now) and self.game_bucket.take(now)
+
+    def mark_answered(self, player_id, index):
+        """Record the player's answer to ``index``; False if it already had one."""
+        with self.lock:
+            return self.answered.test_and_set(player_id, index)
+
+    def _reset_distribution(self, index):
+        # Called with the lock held
+        payload = self.quiz.question_payload(index)
+        self.option_counts = [0] * len(payload['options']) if payload else []
+        self.answer_count = 0
+
+    def tally_answer(self, index, option):
+        """Count a scored answer to question ``index`` in the live distribution."""
+        with self.lock:
+            if index != self.current_question_index:
+                return
+            self.answer_count += 1
+            if type(option) is int and 0 <= option < len(self.option_counts):
+                self.option_counts[option] += 1
+
+    def distribution_frame(self, final=False):
+        with self.lock:
+            return encode_frame(
+                'answer_distribution',
+                question_index=self.current_question_index,
+                counts=list(self.option_counts),
+                answered=self.answer_count,
+                total_players=len(self.scores),
+                final=final
+            )
+
+    def finish(self):
+        with self.lock:
+            self.status = 'FINISHED'
+            self.ended_at = timezone.now()
+        mark_dirty(self)
+        # A finished game is never touched again, persist it promptly
+        write_behind.wake()
+
+    def add_player(self, player_id, name, score=0, joined_at=None):
+        """Add a player to the roster.
+
+        Returns the serialized roster delta for the hosts, or None when the
+        player was already in the roster.
+        """
+        _player_games[player_id] = self.game_code
+        with self.lock:
+            if player_id not in self.scores:
+                self.scores[player_id] = score
+                self.leaderboard.set(player_id, score)
+            if player_id in self.players:
+                return None
+            entry = self.departed.pop(player_id, None)
+            if entry is None:
+                entry = roster_entry(player_id, name, joined_at or timezone.now())
+            self.players[player_id] = entry
+            return self._roster_changed('joined', entry)
+
+    def reserve_seat(self):
+        """Hold a seat for a joining player, or return False when the game is full.
+
+        Every join of a game runs on the process that owns it, so this
+        in-memory count is the only admission check needed.
+        """
+        with self.lock:
+            if len(self.scores) + self.reserved_seats >= self.max_players:
+                return False
+            self.reserved_seats += 1
+            return True
+
+    def release_seat(self):
+        # Called once the reserved player has been added, or has failed to
+        with self.lock:
+            self.reserved_seats -= 1
+
+    def readmit_player(self, player_id):
+        """Put a known player back in the roster without a database lookup.
+
+        Returns ``(known, delta)``; ``known`` is False when the player has
+        never been seen by this game and must be loaded instead.
+        """
+        with self.lock:
+            if player_id in self.players:
+                return True, None
+            entry = self.departed.get(player_id)
+        if entry is None:
+            return False, None
+        return True, self.add_player(player_id, entry['name'])
+
+    def remove_player(self, player_id):
+        """Drop a player from the roster, returning the delta like ``add_player``."""
+        with self.lock:
+            entry = self.players.pop(player_id, None)
+            if entry is None:
+                return None
+            self.departed[player_id] = entry
+            return self._roster_changed('left', player_id)
+
+    def _roster_changed(self, kind, item):
+        # Called with the lock held
+        self.roster_version += 1
+        self.roster_log.append((self.roster_version, kind, item))
+        return encode_frame(
+            'roster_delta',
+            version=self.roster_version,
+            count=len(self.players),
+            joined=[item] if kind == 'joined' else [],
+            left=[item] if kind == 'left' else []
+        )
+
+    def roster_snapshot(self):
+        with self.lock:
+            return {
+                'version': self.roster_version,
+                'count': len(self.players),
+                'players': list(self.players.values())
+            }
+
+    def roster_since(self, since):
+        """Roster changes after version ``since``.
+
+        Returns None when ``since`` is older than the retained log (or from
+        the future), in which case the caller falls back to a snapshot.
+        """
+        with self.lock:
+            version = self.roster_version
+            if since > version:
+                return None
+            if since < version and since < self.roster_log[0][0] - 1:
+                return None
+            joined = {}
+            left = []
+            for change_version, kind, item in self.roster_log:
+                if change_version <= since:
+                    continue
+                if kind == 'joined':
+                    joined[item['id']] = item
+                elif joined.pop(item, None) is None:
+                    left.append(item)
+            return {
+                'version': version,
+                'count': len(self.players),
+                'joined': list(joined.values()),
+                'left': left
+            }
+
+    def add_points(self, player_id, points):
+        with self.lock:
+            total = self.scores.get(player_id, 0) + points
+            self.scores[player_id] = total
+        if points:
+            self.leaderboard.incr(player_id, points)
+            if self.redis_leaderboard is not None:
+                self.redis_leaderboard.set(player_id, total)
+        return total
+
+    def player_name(self, player_id):
+        entry = self.players.get(player_id) or self.departed.get(player_id)
+        return entry['name'] if entry else ''
+
+    def leaderboard_top(self, limit=LEADERBOARD_SIZE):
+        return [
+            {
+                'rank': rank,
+                'id': player_id,
+                'name': self.player_name(player_id),
+                'score': score
+            }
+            for rank, (player_id, score) in enumerate(self.leaderboard.top(limit), 1)
+        ]
+
+    def leaderboard_frame(self, limit=LEADERBOARD_SIZE):
+        # One shared frame per question; personal ranks are added per socket
+        return encode_frame(
+            'leaderboard',
+            top=self.leaderboard_top(limit),
+            total_players=len(self.leaderboard)
+        )
+
+    def player_rank(self, player_id):
+        rank = self.leaderboard.rank(player_id)
+        if rank is None:
+            return None
+        return {
+            'rank': rank,
+            'score': self.leaderboard.score(player_id),
+            'total_players': len(self.leaderboard)
+        }
+
+    def snapshot(self, player_id=None):
+        """Current state for a socket too far behind to replay the event log."""
+        return {
+            'type': 'snapshot',
+            'seq': self.events.seq,
+            'status': self.status,
+            'question': self.question_payload() if self.status == 'ACTIVE' else None,
+            'top': self.leaderboard_top(),
+            'total_players': len(self.leaderboard),
+            'me': self.player_rank(player_id) if player_id is not None else None
+        }
+
+    def to_session(self):
+        return GameSession(
+            id=self.session_id,
+            status=self.status,
+            current_question_index=self.current_question_index,
+            started_at=self.started_at,
+            ended_at=self.ended_at
+        )
+
+
+_games = {}
+_dirty = {}
+# player id -> game code, so answers find their game without a query
+_player_games = {}
+_lock = threading.Lock()
+
+SESSION_FIELDS = ['status', 'current_question_index', 'started_at', 'ended_at']
+
+
+def peek_game(game_code):
+    """Return the live game for ``game_code`` without touching the database."""
+    return _games.get(game_code)
+
+
+def code_sessions(game_code):
+    """The code's game sessions, newest first: ``.first()`` is the code's game.
+
+    Every lookup of a session by code goes through here, so they all agree
+    on which session that is when a code has more than one.
+    """
+    return GameSession.objects.filter(game_code=game_code).order_by('-id')
+
+
+def load_game(game_code):
+    """Return the live game for ``game_code``, loading it on first use.
+
+    Synchronous: async callers go through ``db_sync_to_async``.
+    """
+    game = _games.get(game_code)
+    if game is not None:
+        return game
+    session = (
+        code_sessions(game_code)
+        .only('game_code', 'quiz_id', 'status', 'current_question_index',
+              'started_at', 'ended_at')
+        .first()
+    )
+    if session is None:
+        return None
+    quiz = get_compiled_quiz(session.quiz_id)
+    players = session.players.order_by('joined_at').values_list('id', 'name', 'score', 'joined_at')
+    state = GameState(session, quiz, players)
+    if state.status == 'ACTIVE':
+        # Reloaded mid-question: answers scored before stay scored
+        index = state.current_question_index
+        for player_id in answers.answered_players(session.id, index):
+            state.mark_answered(player_id, index)
+    with _lock:
+        # Another thread may have loaded it while we were querying
+        game = _games.setdefault(game_code, state)
+        if game is state:
+            for player_id in game.scores:
+                _player_games[player_id] = game_code
+    write_behind.start()
+    return game
+
+
+def create_player(game, name):
+    """Insert a player row for ``game``; None if the name is taken."""
+    try:
+        # Autocommit: a failed insert leaves the connection usable
+        return Player.objects.create(session_id=game.session_id, name=name)
+    except IntegrityError:
+        return None
+
+
+def player_game_code(player_id):
+    """Game code of ``player_id``'s game, without a query once it is known."""
+    game_code = _player_games.get(player_id)
+    if game_code is None:
+        game_code = Player.objects.filter(id=player_id).values_list(
+            'session__game_code', flat=True
+        ).first()
+    return game_code
+
+
+def game_for_player(player_id):
+    """Return the live game ``player_id`` belongs to.
+
+    Only the first lookup for a player not already in a loaded roster costs
+    a query.
+    """
+    game_code = _player_games.get(player_id)
+    if game_code is not None:
+        game = load_game(game_code)
+        if game is not None and player_id in game.scores:
+            return game
+    row = (
+        Player.objects.filter(id=player_id)
+        .values_list('session__game_code', 'name', 'score', 'joined_at')
+        .first()
+    )
+    if row is None:
+        return None
+    game_code, name, score, joined_at = row
+    game = load_game(game_code)
+    if game is not None:
+        delta = game.add_player(player_id, name, score, joined_at)
+        if delta:
+            send_frame_sync(game_code, delta, hosts_only=True)
+    return game
+
+
+def drop_game(game_code):
+    with _lock:
+        _games.pop(game_code, None)
+
+
+def mark_dirty(game):
+    with _lock:
+        _dirty[game.session_id] = game
+
+
+def flush_games():
+    with _lock:
+        pending = list(_dirty.values())
+        _dirty.clear()
+    if pending:
+        try:
+            GameSession.objects.bulk_update(
+                [game.to_session() for game in pending], SESSION_FIELDS
+            )
+        except Exception:
+            with _lock:
+                for game in pending:
+                    _dirty.setdefault(game.session_id, game)
+            raise
+    evict_games()
+
+
+def evict_games(now=None):
+    # Persisted games leave memory once finished, including ones loaded
+    # again after they ended (a host page still polling, a late join), or
+    # once idle; a command for them reloads them from the database
+    idle_before = (now or time.monotonic()) - IDLE_SECONDS
+    with _lock:
+        for game_code, game in list(_games.items()):
+            if game.session_id in _dirty:
+                continue
+            if game.status == 'FINISHED' or game.last_command_at < idle_before:
+                del _games[game_code]
+                for player_id in game.scores:
+                    if _player_games.get(player_id) == game_code:
+                        del _player_games[player_id]
+
+
+write_behind.register(flush_games)
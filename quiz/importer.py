@@ -0,0 +1,189 @@
+"""Bulk quiz import from large JSON files.
+
+Accepts a top-level JSON array of quizzes, JSON Lines, or a single quiz
+object. Each quiz is in the ``sample_quiz.json`` shape (``questions`` with
+``question``/``options``/``correct_answer``) plus optional ``title``,
+``description`` and ``time_per_question``. Records are decoded one at a
+time so memory stays flat regardless of file size.
+"""
+import codecs
+import json
+import time
+
+from django.db import IntegrityError, transaction
+
+from .listing import invalidate_quiz_listing
+from .models import Quiz
+
+CHUNK_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 50
+
+
+class QuizFormatError(ValueError):
+    pass
+
+
+def iter_json_records(stream, chunk_size=CHUNK_SIZE):
+    """Yield JSON values one by one from ``stream`` (text or binary).
+
+    A top-level array yields its elements; otherwise whitespace separated
+    values (JSON Lines, or one object) are yielded in order.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    in_array = None
+    # Incremental, so multi-byte characters split across chunks survive
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+
+    def read_more():
+        nonlocal buffer, position, eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        if isinstance(chunk, bytes):
+            chunk = utf8.decode(chunk, final=eof)
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    while True:
+        # Skip whitespace and, inside an array, the separating commas
+        while True:
+            while position < len(buffer) and (
+                buffer[position].isspace() or (in_array and buffer[position] == ',')
+            ):
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            read_more()
+        if position >= len(buffer):
+            if in_array:
+                raise QuizFormatError('Unterminated JSON array')
+            return
+
+        if in_array is None:
+            in_array = buffer[position] == '['
+            if in_array:
+                position += 1
+                continue
+        if in_array and buffer[position] == ']':
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as exc:
+            if eof:
+                raise QuizFormatError(f'Invalid JSON: {exc}') from exc
+            # The value straddles a chunk boundary
+            read_more()
+            continue
+        if end == len(buffer) and not eof:
+            # A number at the end of the buffer may continue in the next chunk
+            read_more()
+            continue
+        position = end
+        yield value
+
+
+def validate_quiz(record, default_time_per_question=30):
+    """Check one quiz record and return the fields for ``Quiz``."""
+    if not isinstance(record, dict):
+        raise QuizFormatError('Quiz must be a JSON object')
+    questions = record.get('questions')
+    if not isinstance(questions, list) or not questions:
+        raise QuizFormatError('"questions" must be a non-empty list')
+
+    for number, question in enumerate(questions, 1):
+        if not isinstance(question, dict):
+            raise QuizFormatError(f'Question {number} must be an object')
+        text = question.get('question')
+        if not isinstance(text, str) or not text.strip():
+            raise QuizFormatError(f'Question {number}: "question" must be a non-empty string')
+        options = question.get('options')
+        if (not isinstance(options, list) or len(options) < 2
+                or not all(isinstance(option, str) for option in options)):
+            raise QuizFormatError(f'Question {number}: "options" must be a list of at least 2 strings')
+        correct_answer = question.get('correct_answer')
+        if (not isinstance(correct_answer, int) or isinstance(correct_answer, bool)
+                or not 0 <= correct_answer < len(options)):
+            raise QuizFormatError(f'Question {number}: "correct_answer" must index into "options"')
+        points = question.get('points', 100)
+        if not isinstance(points, int) or isinstance(points, bool) or points < 0:
+            raise QuizFormatError(f'Question {number}: "points" must be a non-negative integer')
+
+    time_per_question = record.get('time_per_question', default_time_per_question)
+    if not isinstance(time_per_question, int) or time_per_question <= 0:
+        raise QuizFormatError('"time_per_question" must be a positive integer')
+
+    title = record.get('title') or 'Imported quiz'
+    return {
+        'title': str(title)[:200],
+        'description': str(record.get('description', '')),
+        'quiz_data': {'questions': questions},
+        'time_per_question': time_per_question,
+    }
+
+
+def _insert_batch(rows):
+    # Codes for the whole batch come from one allocation; the insert only
+    # fails if one collides with an old random code, so retry once
+    for attempt in range(2):
+        codes = Quiz.generate_game_codes(len(rows))
+        quizzes = [Quiz(game_code=code, **fields) for code, fields in zip(codes, rows)]
+        try:
+            with transaction.atomic():
+                # bulk_create skips Quiz.save(): compiled quizzes and QR codes
+                # are built lazily on first use
+                Quiz.objects.bulk_create(quizzes)
+            invalidate_quiz_listing()
+            return
+        except IntegrityError:
+            if attempt:
+                raise
+
+
+def import_quizzes(records, batch_size=500, default_time_per_question=30, dry_run=False):
+    """Validate and insert quiz records in batches.
+
+    Returns a stats dict with ``imported``, ``rejected``, ``errors`` (the
+    first few, as ``(record number, message)``), ``seconds`` and
+    ``rows_per_second``.
+    """
+    started = time.perf_counter()
+    imported = rejected = 0
+    errors = []
+    batch = []
+
+    def flush():
+        nonlocal imported
+        if batch and not dry_run:
+            _insert_batch(batch)
+        imported += len(batch)
+        batch.clear()
+
+    number = 0
+    try:
+        for number, record in enumerate(records, 1):
+            try:
+                batch.append(validate_quiz(record, default_time_per_question))
+            except QuizFormatError as exc:
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append((number, str(exc)))
+                continue
+            if len(batch) >= batch_size:
+                flush()
+    except QuizFormatError as exc:
+        # The stream itself is broken: keep what was read so far
+        errors.append((number + 1, str(exc)))
+    flush()
+
+    seconds = time.perf_counter() - started
+    return {
+        'imported': imported,
+        'rejected': rejected,
+        'errors': errors,
+        'seconds': seconds,
+        'rows_per_second': imported / seconds if seconds else 0.0,
+    }
@@ -0,0 +1,94 @@
+import threading
+from collections import defaultdict
+
+from django.db.models import Case, F, IntegerField, Value, When
+
+from . import answers
+from .flush import write_behind
+from .models import Player
+
+# Largest number of WHEN branches per UPDATE, keeps well under the
+# bound-parameter limit of older SQLite builds
+FLUSH_CHUNK_SIZE = 250
+
+# player id -> points not yet written to Player.score
+_deltas = defaultdict(int)
+_lock = threading.Lock()
+
+
+def submit_answer(game, player_id, question_index, selected_answer, received_at):
+    """Score one answer against the game's answer key and queue its points.
+
+    ``received_at`` is the server's ``time.time()`` when the answer
+    arrived; the speed bonus is measured from the question opening on the
+    server, scaled to the quiz's ``time_per_question``.
+
+    Returns the result sent back to the player, or None when the question
+    index is out of range. Answers over the rate limits, to a question that
+    is no longer open, or to one the player already answered get an error
+    result. No database access happens here; the points are persisted by
+    ``flush_scores`` and the answer itself by ``answers.flush_answers``.
+    """
+    if not isinstance(question_index, int) or not 0 <= question_index < game.total_questions:
+        return None
+    if not game.allow_answer(player_id):
+        return {'error': 'Too many answers'}
+    response_time = game.response_time(question_index, received_at)
+    if response_time is None:
+        return {'error': 'Question closed'}
+    # Only the first answer per question counts
+    if not game.mark_answered(player_id, question_index):
+        return {'error': 'Already answered'}
+    correct_answer = game.correct_answers[question_index]
+    is_correct = selected_answer == correct_answer
+
+    # Calculate points (faster answers get more points)
+    points = 0
+    if is_correct:
+        base_points = game.points[question_index]
+        time_limit = game.time_per_question
+        time_bonus = max(0, (time_limit - response_time) / time_limit * 50)  # Up to 50 bonus points
+        points = int(base_points + time_bonus)
+
+    total_score = game.add_points(player_id, points)
+    if points:
+        with _lock:
+            _deltas[player_id] += points
+    answers.record(game.session_id, player_id, question_index, selected_answer, response_time)
+    game.tally_answer(question_index, selected_answer)
+    write_behind.start()
+
+    return {
+        'correct': is_correct,
+        'points_earned': points,
+        'total_score': total_score,
+        'correct_answer': correct_answer
+    }
+
+
+def flush_scores():
+    """Apply every queued score delta with bulk ``F()`` updates."""
+    with _lock:
+        pending = list(_deltas.items())
+        _deltas.clear()
+    if not pending:
+        return
+    try:
+        for start in range(0, len(pending), FLUSH_CHUNK_SIZE):
+            chunk = pending[start:start + FLUSH_CHUNK_SIZE]
+            Player.objects.filter(id__in=[player_id for player_id, _ in chunk]).update(
+                score=F('score') + Case(
+                    *[When(id=player_id, then=Value(delta)) for player_id, delta in chunk],
+                    default=Value(0),
+                    output_field=IntegerField()
+                )
+            )
+    except Exception:
+        # Put back whatever was not written so the next flush retries it
+        with _lock:
+            for player_id, delta in pending[start:]:
+                _deltas[player_id] += delta
+        raise
+
+
+write_behind.register(flush_scores)
@@ -0,0 +1,209 @@
+import random
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+from .flush import write_behind
+
+MAX_LEVELS = 20
+_END_KEY = (float('inf'), 0)
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        # width[level]: how many level-0 steps next[level] jumps over
+        self.width = [1] * levels
+
+
+class SkipListLeaderboard:
+    """In-memory ranking of one game as an indexable skiplist.
+
+    Entries are ordered by ``(-score, player_id)``, so score updates, rank
+    lookups and reaching the N-th entry are all O(log n) expected.
+    """
+
+    def __init__(self, scores=()):
+        self._end = _Node(_END_KEY, 0)
+        self._head = _Node(None, MAX_LEVELS)
+        self._head.next = [self._end] * MAX_LEVELS
+        self._scores = {}
+        self._lock = threading.Lock()
+        for player_id, score in scores:
+            self.set(player_id, score)
+
+    def __len__(self):
+        return len(self._scores)
+
+    def score(self, player_id):
+        return self._scores.get(player_id)
+
+    def set(self, player_id, score):
+        with self._lock:
+            old = self._scores.get(player_id)
+            if old is not None:
+                self._remove((-old, player_id))
+            self._scores[player_id] = score
+            self._insert((-score, player_id))
+
+    def incr(self, player_id, delta):
+        with self._lock:
+            old = self._scores.get(player_id)
+            if old is not None:
+                self._remove((-old, player_id))
+            score = (old or 0) + delta
+            self._scores[player_id] = score
+            self._insert((-score, player_id))
+            return score
+
+    def remove(self, player_id):
+        with self._lock:
+            old = self._scores.pop(player_id, None)
+            if old is not None:
+                self._remove((-old, player_id))
+
+    def rank(self, player_id):
+        """1-based rank of ``player_id``, or None if it has no score."""
+        with self._lock:
+            score = self._scores.get(player_id)
+            if score is None:
+                return None
+            key = (-score, player_id)
+            node = self._head
+            position = 0
+            for level in reversed(range(MAX_LEVELS)):
+                while node.next[level].key <= key:
+                    position += node.width[level]
+                    node = node.next[level]
+            return position
+
+    def top(self, n):
+        """The ``n`` best ``(player_id, score)`` pairs, best first."""
+        with self._lock:
+            result = []
+            node = self._head.next[0]
+            while node is not self._end and len(result) < n:
+                result.append((node.key[1], -node.key[0]))
+                node = node.next[0]
+            return result
+
+    def _insert(self, key):
+        chain = [None] * MAX_LEVELS
+        steps_at_level = [0] * MAX_LEVELS
+        node = self._head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = 1
+        while levels < MAX_LEVELS and random.random() < 0.5:
+            levels += 1
+        new_node = _Node(key, levels)
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, MAX_LEVELS):
+            chain[level].width[level] += 1
+
+    def _remove(self, key):
+        chain = [None] * MAX_LEVELS
+        node = self._head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        if target.key != key:
+            return
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), MAX_LEVELS):
+            chain[level].width[level] -= 1
+
+
+class RedisLeaderboard:
+    """Mirror of a game's ranking in a Redis sorted set.
+
+    Score changes are buffered in memory and written with one pipeline per
+    write-behind flush, so the answer path never waits on Redis. Reads go
+    straight to Redis and are meant for processes that do not hold the
+    game in memory.
+    """
+
+    def __init__(self, session_id, client=None):
+        self.key = f'quiz:leaderboard:{session_id}'
+        self.client = client or redis_client()
+
+    def set(self, player_id, score):
+        with _pending_lock:
+            _pending_sets[self.key][player_id] = score
+
+    def top(self, n):
+        rows = self.client.zrevrange(self.key, 0, n - 1, withscores=True)
+        return [(int(member), int(score)) for member, score in rows]
+
+    def rank(self, player_id):
+        rank = self.client.zrevrank(self.key, player_id)
+        return None if rank is None else rank + 1
+
+    def score(self, player_id):
+        score = self.client.zscore(self.key, player_id)
+        return None if score is None else int(score)
+
+    def __len__(self):
+        return self.client.zcard(self.key)
+
+
+_client = None
+# sorted-set key -> {player id: latest score}
+_pending_sets = defaultdict(dict)
+_pending_lock = threading.Lock()
+
+
+def redis_client():
+    global _client
+    if _client is None:
+        import redis
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
+
+
+def redis_enabled():
+    return getattr(settings, 'QUIZ_LEADERBOARD_REDIS', False)
+
+
+def flush_leaderboards():
+    with _pending_lock:
+        pending = dict(_pending_sets)
+        _pending_sets.clear()
+    if not pending:
+        return
+    pipe = redis_client().pipeline(transaction=False)
+    for key, scores in pending.items():
+        pipe.zadd(key, scores)
+        # Finished games age out of Redis on their own
+        pipe.expire(key, 24 * 60 * 60)
+    try:
+        pipe.execute()
+    except Exception:
+        with _pending_lock:
+            for key, scores in pending.items():
+                # Newer scores queued meanwhile win over the failed batch
+                _pending_sets[key] = {**scores, **_pending_sets[key]}
+        raise
+
+
+write_behind.register(flush_leaderboards)
@@ -0,0 +1,67 @@
+from django.core.cache import cache
+from django.db.models.functions import Lower
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+CACHE_TIMEOUT = 5 * 60
+_VERSION_KEY = 'quiz:list:version'
+
+
+def _version():
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        cache.add(_VERSION_KEY, 1, None)
+        version = cache.get(_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_quiz_listing():
+    # Bumping the version orphans every cached page at once
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.add(_VERSION_KEY, 1, None)
+
+
+def list_quizzes(q='', cursor=None, limit=PAGE_SIZE):
+    """One page of quizzes, newest first, as plain dicts.
+
+    Keyset-paginated on the primary key: ``cursor`` is the last id of the
+    previous page. ``q`` is a case-insensitive title prefix, matched as a
+    range on the ``Lower(title)`` index rather than a LIKE scan.
+    """
+    from .models import Quiz
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    q = q.strip().lower()
+    key = f'quiz:list:{_version()}:{cursor or ""}:{limit}:{q}'
+    page = cache.get(key)
+    if page is not None:
+        return page
+
+    quizzes = Quiz.objects.all()
+    if q:
+        quizzes = quizzes.annotate(title_lower=Lower('title')).filter(
+            title_lower__gte=q, title_lower__lt=q + '\U0010ffff'
+        )
+    if cursor is not None:
+        quizzes = quizzes.filter(id__lt=cursor)
+    # Fetch one extra row to know whether there is a next page
+    rows = list(
+        quizzes.order_by('-id').values('id', 'title', 'description', 'game_code')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    page = {
+        'quizzes': [
+            {
+                'title': row['title'],
+                'description': row['description'],
+                'game_code': row['game_code']
+            }
+            for row in rows
+        ],
+        'next_cursor': rows[-1]['id'] if has_more else None
+    }
+    cache.set(key, page, CACHE_TIMEOUT)
+    return page
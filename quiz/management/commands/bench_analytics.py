@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from quiz import analytics, answers
+from quiz.compiled import get_compiled_quiz
+from quiz.models import GameSession, Player, Quiz
+
+
+class Command(BaseCommand):
+    help = 'Time the post-game analytics report of a synthetic finished game'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=2000)
+        parser.add_argument('--questions', type=int, default=50)
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        quiz = Quiz.objects.create(
+            title='Analytics benchmark',
+            max_players=options['players'],
+            quiz_data={'questions': [
+                {
+                    'question': f'Benchmark question {i}?',
+                    'options': ['Alpha', 'Bravo', 'Charlie', 'Delta'],
+                    'correct_answer': i % 4,
+                }
+                for i in range(options['questions'])
+            ]}
+        )
+        session = GameSession.objects.create(quiz=quiz, status='FINISHED')
+        try:
+            players = Player.objects.bulk_create([
+                Player(session=session, name=f'player {n}') for n in range(options['players'])
+            ])
+            started = time.perf_counter()
+            rng = random.Random(1)
+            # One flush per question, as the write-behind thread would do
+            for index in range(options['questions']):
+                for player in players:
+                    answers.record(session.id, player.id, index, rng.randrange(4),
+                                   rng.uniform(0.5, 30))
+                answers.flush_answers()
+            recorded = time.perf_counter() - started
+            total = options['players'] * options['questions']
+            self.stdout.write(f'recorded and flushed {total:,} answers in {recorded * 1000:.0f} ms')
+
+            compiled = get_compiled_quiz(quiz.id)
+            timings = []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                columns = analytics.load_columns(session.id)
+                loaded = time.perf_counter()
+                report = analytics.report(columns, compiled)
+                timings.append((loaded - started, time.perf_counter() - loaded))
+            load, compute = min(timings, key=sum)
+            self.stdout.write(
+                f'report: load {load * 1000:.1f} ms, aggregate {compute * 1000:.1f} ms, '
+                f'total {(load + compute) * 1000:.1f} ms (best of {options["runs"]})'
+            )
+            if report['total_answers'] != total:
+                self.stdout.write(self.style.ERROR(
+                    f"report counted {report['total_answers']:,} answers, expected {total:,}"
+                ))
+            hardest = report['hardest'][0]
+            self.stdout.write(f"hardest question: #{hardest['index'] + 1} "
+                              f"({hardest['accuracy']:.1%} correct)")
+        finally:
+            quiz.delete()
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import time
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from quiz import game_state, protocol
+from quiz.models import GameSession, Quiz
+
+
+class Command(BaseCommand):
+    help = 'Measure question fan-out throughput for many players on one game'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=1000)
+        parser.add_argument('--questions', type=int, default=10)
+        parser.add_argument(
+            '--memory-layer', action='store_true',
+            help='Use the in-memory channel layer instead of the configured one'
+        )
+        parser.add_argument(
+            '--compact', action='store_true',
+            help='Connect the players with the compact msgpack subprotocol'
+        )
+
+    def handle(self, *args, **options):
+        quiz = Quiz.objects.create(
+            title='Broadcast benchmark',
+            quiz_data={'questions': [
+                {
+                    'question': f'Benchmark question {i}?',
+                    'options': ['Alpha', 'Bravo', 'Charlie', 'Delta'],
+                    'correct_answer': i % 4,
+                }
+                for i in range(options['questions'])
+            ]}
+        )
+        GameSession.objects.create(quiz=quiz)
+        try:
+            if options['memory_layer']:
+                layers = {'default': {
+                    'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                    'CONFIG': {'capacity': options['questions'] + 10},
+                }}
+                with override_settings(CHANNEL_LAYERS=layers):
+                    results, received = asyncio.run(self.run(quiz.game_code, options))
+            else:
+                results, received = asyncio.run(self.run(quiz.game_code, options))
+        finally:
+            game_state.drop_game(quiz.game_code)
+            quiz.delete()
+
+        players = options['players']
+        for index, elapsed in enumerate(results):
+            self.stdout.write(
+                f'question {index + 1}: {players} sockets in {elapsed * 1000:.1f} ms '
+                f'({players / elapsed:,.0f} frames/s)'
+            )
+        total = sum(results)
+        self.stdout.write(self.style.SUCCESS(
+            f'{players * len(results)} frames delivered in {total:.3f}s: '
+            f'{players * len(results) / total:,.0f} frames/s, '
+            f'{total / len(results) * 1000:.1f} ms per question'
+        ))
+        self.stdout.write(
+            f'egress: {received / players:,.0f} bytes per player socket over the game'
+        )
+
+    async def run(self, game_code, options):
+        from quiz_app.asgi import application
+
+        path = f'/ws/game/{game_code}/'
+        host = WebsocketCommunicator(application, path)
+        await host.connect()
+        subprotocols = [protocol.SUBPROTOCOL] if options['compact'] else None
+        players = []
+        for _ in range(options['players']):
+            communicator = WebsocketCommunicator(application, path, subprotocols=subprotocols)
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise RuntimeError('player socket was rejected')
+            players.append(communicator)
+
+        results = []
+        received = 0
+        message_type = 'start_game'
+        for _ in range(options['questions']):
+            started = time.perf_counter()
+            await host.send_to(text_data=json.dumps({'type': message_type}))
+            frames = await asyncio.gather(*(p.receive_from(timeout=30) for p in players))
+            results.append(time.perf_counter() - started)
+            received += sum(len(frame) for frame in frames)
+            await host.receive_from(timeout=30)
+            message_type = 'next_question'
+        # Frames still queued behind the timed ones (leaderboards)
+        for frames in await asyncio.gather(*(self.drain(p) for p in players)):
+            received += frames
+
+        await database_sync_to_async(self.flush)()
+        for communicator in [host] + players:
+            await communicator.disconnect()
+        return results, received
+
+    async def drain(self, communicator):
+        received = 0
+        while not await communicator.receive_nothing(timeout=0.5):
+            received += len(await communicator.receive_from())
+        return received
+
+    def flush(self):
+        from quiz.flush import write_behind
+        write_behind.flush_now()
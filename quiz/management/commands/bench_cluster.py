@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from importlib import import_module
+
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.models import GameSession, Player, Quiz
+
+
+class Command(BaseCommand):
+    help = (
+        'Multi-worker load test: players per second as live games are spread '
+        'over 1..N worker processes sharing a Redis server (REDIS_URL), and '
+        'how long the closing leaderboard takes to reach every player'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--games', type=int, default=20)
+        parser.add_argument('--players', type=int, default=100, help='Players per game')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Players in flight at once in each worker')
+        # Internal: run as one worker of a measurement
+        parser.add_argument('--child', nargs=3, metavar=('FIXTURE', 'INDEX', 'WORKERS'),
+                            help='run as worker INDEX of WORKERS (internal)')
+
+    def handle(self, *args, **options):
+        if options['child']:
+            fixture, index, workers = options['child']
+            result = asyncio.run(self.run_worker(fixture, int(index), int(workers), options))
+            self.stdout.write(json.dumps(result))
+            return
+
+        # Near-linear scaling keeps efficiency (speedup per worker) close to 1
+        self.stdout.write(f"{'workers':>7} {'players':>8} {'seconds':>8} "
+                          f"{'players/s':>10} {'speedup':>8} {'efficiency':>10} "
+                          f"{'leaderboard ms':>14}")
+        baseline = None
+        for workers in options['workers']:
+            players, seconds, leaderboard, errors = self.measure(workers, options)
+            rate = players / seconds
+            baseline = baseline or rate
+            self.stdout.write(
+                f'{workers:>7} {players:>8} {seconds:>8.2f} {rate:>10,.0f} '
+                f'{rate / baseline:>7.2f}x {rate / baseline / workers:>10.2f} '
+                f'{leaderboard * 1000:>14.1f}' + (f'  ({errors} errors)' if errors else '')
+            )
+
+    def measure(self, workers, options):
+        quizzes, fixture = self.create_fixture(options)
+        path = None
+        try:
+            with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as handle:
+                json.dump(fixture, handle)
+                path = handle.name
+            # Every worker is a separate process in cluster mode, as behind a
+            # load balancer; sockets of one game land on all of them
+            env = {**os.environ, 'QUIZ_CLUSTER': '1', 'QUIZ_CHANNEL_LAYER': 'redis'}
+            children = [
+                subprocess.Popen(
+                    [sys.executable, sys.argv[0], 'bench_cluster',
+                     '--child', path, str(index), str(workers),
+                     '--concurrency', str(options['concurrency'])],
+                    env=env, stdout=subprocess.PIPE, text=True
+                )
+                for index in range(workers)
+            ]
+            results = []
+            for child in children:
+                output, _ = child.communicate()
+                if child.returncode:
+                    raise CommandError(f'worker exited with status {child.returncode}')
+                results.append(json.loads(output.strip().splitlines()[-1]))
+        finally:
+            if path:
+                os.unlink(path)
+            self.delete_fixture(quizzes, fixture)
+        return (
+            sum(result['players'] for result in results),
+            max(result['seconds'] for result in results),
+            max(result['leaderboard'] for result in results),
+            sum(result['errors'] for result in results),
+        )
+
+    def create_fixture(self, options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        question = {'question': 'Ready?', 'options': ['Yes', 'No'], 'correct_answer': 0}
+        quizzes = []
+        fixture = {'run': uuid.uuid4().hex, 'games': []}
+        for _ in range(options['games']):
+            # Long enough that the question is still open when players answer
+            quiz = Quiz.objects.create(
+                title='Cluster benchmark', quiz_data={'questions': [question]},
+                time_per_question=3600
+            )
+            session = GameSession.objects.create(quiz=quiz)
+            players = Player.objects.bulk_create(
+                Player(session=session, name=f'player {i}') for i in range(options['players'])
+            )
+            cookies = []
+            for player in players:
+                player_session = store()
+                player_session['player_id'] = player.id
+                player_session.create()
+                cookies.append(player_session.session_key)
+            quizzes.append(quiz)
+            fixture['games'].append({'code': quiz.game_code, 'players': cookies})
+        return quizzes, fixture
+
+    def delete_fixture(self, quizzes, fixture):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        for game in fixture['games']:
+            for key in game['players']:
+                store(session_key=key).delete()
+        for quiz in quizzes:
+            quiz.delete()
+
+    async def run_worker(self, path, index, workers, options):
+        import redis.asyncio
+        from quiz_app.asgi import application
+
+        with open(path) as handle:
+            fixture = json.load(handle)
+        cookie_name = settings.SESSION_COOKIE_NAME.encode()
+
+        # Hosts are split across workers; each host's worker claims its game
+        hosts = []
+        for number, game in enumerate(fixture['games']):
+            if number % workers != index:
+                continue
+            host = WebsocketCommunicator(application, f"/ws/game/{game['code']}/")
+            await host.connect()
+            await host.send_json_to({'type': 'start_game'})
+            await host.receive_json_from(timeout=30)
+            hosts.append(host)
+
+        # Barrier: the timed phase starts once every game is running
+        client = redis.asyncio.Redis.from_url(settings.REDIS_URL)
+        await self.barrier(client, f"quiz:bench:{fixture['run']}:ready", workers)
+
+        # Players are dealt round-robin, so most talk to a game another
+        # worker owns and go through command forwarding
+        mine = [
+            (game['code'], key)
+            for game in fixture['games']
+            for key in game['players']
+        ][index::workers]
+        gate = asyncio.Semaphore(options['concurrency'])
+        errors = 0
+
+        async def play(code, key):
+            nonlocal errors
+            async with gate:
+                socket = WebsocketCommunicator(
+                    application, f'/ws/game/{code}/',
+                    headers=[(b'cookie', cookie_name + b'=' + key.encode())]
+                )
+                await socket.connect()
+                await socket.send_json_to({'type': 'player_joined'})
+                await socket.send_json_to({
+                    'type': 'submit_answer', 'question_index': 0, 'selected_answer': 0
+                })
+                while True:
+                    frame = await socket.receive_json_from(timeout=30)
+                    if frame['type'] == 'answer_result':
+                        break
+                if 'error' in frame:
+                    errors += 1
+            # Stays connected for the leaderboard
+            return socket
+
+        async def ranked(socket):
+            while True:
+                frame = await socket.receive_json_from(timeout=30)
+                if frame['type'] == 'my_rank':
+                    break
+            await socket.disconnect()
+
+        started = time.perf_counter()
+        sockets = await asyncio.gather(*(play(code, key) for code, key in mine))
+        seconds = time.perf_counter() - started
+
+        # Games end only when no worker has players left in flight; the
+        # last question closing sends every player the leaderboard and
+        # their own rank, mostly from a game another worker owns
+        await self.barrier(client, f"quiz:bench:{fixture['run']}:done", workers)
+        started = time.perf_counter()
+        for host in hosts:
+            await host.send_json_to({'type': 'next_question'})
+        await asyncio.gather(*(ranked(socket) for socket in sockets))
+        leaderboard = time.perf_counter() - started
+        for host in hosts:
+            await host.disconnect()
+        await client.aclose()
+        return {'players': len(mine), 'seconds': seconds, 'leaderboard': leaderboard,
+                'errors': errors}
+
+    async def barrier(self, client, key, workers):
+        await client.incr(key)
+        await client.expire(key, 600)
+        while int(await client.get(key)) < workers:
+            await asyncio.sleep(0.01)
@@ -0,0 +1,67 @@
+import random
+import statistics
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from quiz import codes
+from quiz.models import Quiz
+
+
+def legacy_generate_game_code():
+    # The previous allocator: random code plus an existence query per try
+    while True:
+        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+        if not Quiz.objects.filter(game_code=code).exists():
+            return code
+
+
+class Command(BaseCommand):
+    help = 'Compare game code allocation latency as the quiz table grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--existing', type=int, default=1_000_000,
+                            help='Quizzes in the table at the last checkpoint')
+        parser.add_argument('--checkpoints', type=int, default=4)
+        parser.add_argument('--samples', type=int, default=2000,
+                            help='Allocations timed at each checkpoint')
+
+    def handle(self, *args, **options):
+        step = options['existing'] // options['checkpoints']
+        self.stdout.write(f"{'quizzes':>10} {'allocator p50':>14} {'p99':>9} "
+                          f"{'legacy p50':>11} {'p99':>9}  (microseconds)")
+        # Everything is rolled back: the benchmark leaves no rows behind
+        with transaction.atomic():
+            existing = Quiz.objects.count()
+            for checkpoint in range(options['checkpoints'] + 1):
+                if checkpoint:
+                    self.fill(step)
+                    existing += step
+                allocator = self.measure(codes.allocate_game_code, options['samples'])
+                legacy = self.measure(legacy_generate_game_code, options['samples'])
+                self.stdout.write(
+                    f'{existing:>10,} {allocator[0]:>14.1f} {allocator[1]:>9.1f} '
+                    f'{legacy[0]:>11.1f} {legacy[1]:>9.1f}'
+                )
+            transaction.set_rollback(True)
+        # Blocks reserved inside the rolled back transaction were given back
+        codes.allocator = codes.GameCodeAllocator()
+
+    def fill(self, count, batch_size=5000):
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            Quiz.objects.bulk_create(
+                Quiz(title='bench', quiz_data={}, game_code=code)
+                for code in codes.allocate_game_codes(size)
+            )
+
+    def measure(self, allocate, samples):
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            allocate()
+            timings.append((time.perf_counter() - started) * 1e6)
+        timings.sort()
+        return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
@@ -0,0 +1,168 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from quiz.flush import write_behind
+from quiz.models import GameSession, Player, Quiz
+
+# Environment of each measured database profile
+MODES = {
+    'sqlite-rollback': {'QUIZ_DB': 'sqlite', 'QUIZ_SQLITE_WAL': '0'},
+    'sqlite-wal': {'QUIZ_DB': 'sqlite', 'QUIZ_SQLITE_WAL': '1'},
+    'postgres': {'QUIZ_DB': 'postgres'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Answer-ingest throughput through /api/submit-answer/ with concurrent '
+        'joins and write-behind flushes, for each database profile'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=sorted(MODES),
+                            default=['sqlite-rollback', 'sqlite-wal', 'postgres'])
+        parser.add_argument('--players', type=int, default=200)
+        parser.add_argument('--questions', type=int, default=5)
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Concurrent request threads')
+        parser.add_argument('--flush-interval', type=float, default=0.05,
+                            help='Write-behind interval, short to stress the writer')
+        # Internal: measure the profile this process was started with
+        parser.add_argument('--child', action='store_true', help='(internal)')
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(self.measure(options)))
+            return
+
+        self.stdout.write(f"{'mode':<16} {'answers/s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+                          f"{'joins/s':>8} {'flush errors':>12}")
+        for mode in options['modes']:
+            # Each profile needs its own settings, hence its own process
+            child = subprocess.run(
+                [sys.executable, sys.argv[0], 'bench_ingest', '--child',
+                 '--players', str(options['players']),
+                 '--questions', str(options['questions']),
+                 '--threads', str(options['threads']),
+                 '--flush-interval', str(options['flush_interval'])],
+                # Single process: broadcasts can stay on the in-memory layer
+                env={**os.environ, **MODES[mode],
+                     'QUIZ_CHANNEL_LAYER': 'memory', 'QUIZ_AUTO_ADVANCE': '0'},
+                capture_output=True, text=True
+            )
+            if child.returncode:
+                error = (child.stderr.strip().splitlines() or ['failed'])[-1]
+                self.stdout.write(f'{mode:<16} skipped: {error}')
+                continue
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            self.stdout.write(
+                f"{mode:<16} {result['answers_per_second']:>10,.0f} {result['p50_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['joins_per_second']:>8,.0f} "
+                f"{result['flush_errors']:>12}"
+            )
+
+    def measure(self, options):
+        connection.ensure_connection()
+        write_behind.interval = options['flush_interval']
+        question = {'question': 'Ready?', 'options': ['Yes', 'No'], 'correct_answer': 0}
+        quiz = Quiz.objects.create(
+            title='Ingest benchmark', time_per_question=3600,
+            quiz_data={'questions': [question] * options['questions']}
+        )
+        session = GameSession.objects.create(quiz=quiz)
+        players = Player.objects.bulk_create(
+            Player(session=session, name=f'player {i}') for i in range(options['players'])
+        )
+        clients = []
+        for player in players:
+            client = Client()
+            client_session = client.session
+            client_session['player_id'] = player.id
+            client_session.save()
+            clients.append(client)
+
+        flush_errors = 0
+        flush = write_behind.flush_now
+
+        def counted_flush():
+            nonlocal flush_errors
+            try:
+                flush()
+            except Exception:
+                flush_errors += 1
+                raise
+        write_behind.flush_now = counted_flush
+
+        try:
+            host = Client()
+            host.post(f'/api/start-game/{quiz.game_code}/')
+            latencies = []
+            joins = 0
+            done = threading.Event()
+
+            def joiner():
+                # Lobby traffic of other games: plain row inserts that
+                # compete with the flushes for the writer
+                nonlocal joins
+                while not done.is_set():
+                    joins += 1
+                    Player.objects.create(session=session, name=f'late joiner {joins}')
+                connection.close()
+
+            def answer(chunk, index):
+                for client in chunk:
+                    started = time.perf_counter()
+                    response = client.post(
+                        '/api/submit-answer/',
+                        json.dumps({'question_index': index, 'selected_answer': 0}),
+                        content_type='application/json'
+                    )
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise CommandError(f'answer rejected: {response.content!r}')
+                connection.close()
+
+            join_thread = threading.Thread(target=joiner)
+            join_thread.start()
+            started = time.perf_counter()
+            for index in range(options['questions']):
+                threads = [
+                    threading.Thread(target=answer, args=(clients[n::options['threads']], index))
+                    for n in range(options['threads'])
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                host.post(f'/api/next-question/{quiz.game_code}/')
+            write_behind.flush_now()
+            elapsed = time.perf_counter() - started
+            done.set()
+            join_thread.join()
+
+            answers = options['players'] * options['questions']
+            expected = answers * 100
+            stored = sum(Player.objects.filter(id__in=[p.id for p in players])
+                         .values_list('score', flat=True))
+            if stored < expected:
+                raise CommandError(f'scores lost: {stored} stored, at least {expected} expected')
+            latencies.sort()
+            return {
+                'answers_per_second': answers / elapsed,
+                'p50_ms': statistics.median(latencies) * 1000,
+                'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+                'joins_per_second': joins / elapsed,
+                'flush_errors': flush_errors,
+            }
+        finally:
+            write_behind.flush_now = flush
+            quiz.delete()
@@ -0,0 +1,377 @@
+import asyncio
+import json
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, override_settings
+from django.test.utils import setup_databases, teardown_databases
+
+from quiz import game_state
+from quiz.db import on_pool_threads
+from quiz.flush import write_behind
+from quiz.models import GameSession, Quiz
+
+BASELINE = Path(__file__).with_name('bench_load_baseline.json')
+
+# Phases in run order: what one operation is, and how it is timed
+PHASES = [
+    ('join', 'POST /api/join-quiz/, request to response'),
+    ('connect', 'socket connect + player_joined'),
+    ('start', 'start_game to game_started on each player socket'),
+    ('answer_ws', 'submit_answer message to answer_result'),
+    ('answer_http', 'POST /api/submit-answer/, request to response'),
+    ('advance', 'next_question to new_question on each player socket'),
+]
+# Options that change what is measured; a baseline only compares with
+# runs that used the same ones
+SHAPE = ['games', 'hosts', 'players', 'questions', 'http_share', 'memory_layer']
+
+
+class QueryCounter:
+    """Execute wrapper counting queries across threads.
+
+    Installed on this thread, on the engine's DB pool threads and on any
+    connection opened while it is installed (other executors' threads).
+    Write-behind flushes are not counted.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+        self.active = False
+        self._lock = threading.Lock()
+        self.background = threading.local()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.active or getattr(self.background, 'active', False):
+            return execute(sql, params, many, context)
+        with self._lock:
+            self.count += 1
+            self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.statements = []
+
+    def attach(self, connection=connection, **kwargs):
+        # Also the connection_created receiver
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self):
+        flush = write_behind.flush_now
+
+        def uncounted_flush():
+            self.background.active = True
+            try:
+                flush()
+            finally:
+                self.background.active = False
+        write_behind.flush_now = uncounted_flush
+        self.attach()
+        on_pool_threads(lambda: self.attach(connection))
+        connection_created.connect(self.attach, weak=False)
+        self.active = True
+
+    def uninstall(self):
+        # Wrappers left on other threads' connections stay, inactive
+        self.active = False
+        connection_created.disconnect(self.attach)
+        del write_behind.flush_now
+        if self in connection.execute_wrappers:
+            connection.execute_wrappers.remove(self)
+
+
+class Command(BaseCommand):
+    help = (
+        'Load harness: hosts and players per game driving the HTTP views and '
+        'the game socket in one process, checked against a stored baseline. '
+        'Runs against a throwaway test database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=2)
+        parser.add_argument('--hosts', type=int, default=1, help='Host sockets per game')
+        parser.add_argument('--players', type=int, default=50, help='Players per game')
+        parser.add_argument('--questions', type=int, default=3)
+        parser.add_argument('--http-share', type=float, default=0.25,
+                            help='Share of players answering over HTTP instead of the socket')
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='HTTP requests in flight at once')
+        parser.add_argument(
+            '--configured-layer', dest='memory_layer', action='store_false',
+            help='Use the configured channel layer instead of the in-memory one'
+        )
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store this run as the baseline instead of comparing')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed relative slowdown of p99 and throughput')
+
+    def handle(self, *args, **options):
+        # The quizzes, players and client sessions of a run all go with
+        # the test database; on SQLite it is a file, like the real one
+        with tempfile.TemporaryDirectory() as scratch:
+            if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+                connection.settings_dict['TEST']['NAME'] = str(Path(scratch) / 'bench_load.sqlite3')
+            old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+            try:
+                results = self.measure(options)
+            finally:
+                # Pool threads keep their connections open
+                on_pool_threads(connections.close_all)
+                teardown_databases(old_config, verbosity=0)
+
+        self.report(results)
+        shape = {name: options[name] for name in SHAPE}
+        path = Path(options['baseline'])
+        if options['save_baseline']:
+            path.write_text(json.dumps({'shape': shape, 'phases': results}, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'baseline saved to {path}'))
+            return
+        if not path.exists():
+            self.stdout.write('no baseline stored; run with --save-baseline to record one')
+            return
+        baseline = json.loads(path.read_text())
+        if baseline['shape'] != shape:
+            raise CommandError(f"baseline was recorded with {baseline['shape']}")
+        regressions = self.compare(results, baseline['phases'], options['tolerance'])
+        if regressions:
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            raise CommandError(f'{len(regressions)} regression(s) against {path}')
+        self.stdout.write(self.style.SUCCESS('no regressions against the baseline'))
+
+    def measure(self, options):
+        games = [self.create_game(options) for _ in range(options['games'])]
+        try:
+            if options['memory_layer']:
+                layers = {'default': {
+                    'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                    'CONFIG': {'capacity': 1000},
+                }}
+                with override_settings(CHANNEL_LAYERS=layers):
+                    return asyncio.run(self.run(games, options))
+            return asyncio.run(self.run(games, options))
+        finally:
+            write_behind.flush_now()
+            for game in games:
+                game_state.drop_game(game['code'])
+
+    def create_game(self, options):
+        quiz = Quiz.objects.create(
+            title='Load harness',
+            # Long deadlines: questions only move when the hosts say so
+            time_per_question=3600,
+            max_players=options['players'],
+            quiz_data={'questions': [
+                {
+                    'question': f'Load question {i}?',
+                    'options': ['Alpha', 'Bravo', 'Charlie', 'Delta'],
+                    'correct_answer': i % 4,
+                }
+                for i in range(options['questions'])
+            ]}
+        )
+        GameSession.objects.create(quiz=quiz)
+        # Players get their session cookie from the join phase
+        clients = [AsyncClient() for _ in range(options['players'])]
+        hosts = []
+        for _ in range(options['hosts']):
+            client = AsyncClient()
+            client_session = client.session
+            client_session['is_quiz_host'] = quiz.game_code
+            client_session.save()
+            hosts.append(client)
+        http_players = int(len(clients) * options['http_share'])
+        return {
+            'quiz': quiz,
+            'code': quiz.game_code,
+            'hosts': hosts,
+            'clients': clients,
+            # The first players answer over HTTP, the rest over the socket
+            'http_players': http_players,
+        }
+
+    async def run(self, games, options):
+        from quiz_app.asgi import application
+
+        counter = QueryCounter()
+        await sync_to_async(counter.install)()
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        results = {}
+        try:
+            async def phase(name, coroutines):
+                counter.reset()
+                started = time.perf_counter()
+                samples = [s for batch in await asyncio.gather(*coroutines) for s in batch]
+                elapsed = time.perf_counter() - started
+                queries = counter.count
+                previous = results.get(name)
+                if previous is not None:
+                    # Repeated phases (one per question) are pooled
+                    samples += previous['samples']
+                    elapsed += previous['elapsed']
+                    queries += previous['queries']
+                results[name] = {'samples': samples, 'elapsed': elapsed, 'queries': queries}
+
+            await phase('join', [self.join(game, semaphore) for game in games])
+            await phase('connect', [self.connect(game, application) for game in games])
+            await phase('start', [self.fan_out(game, 'start_game', 'game_started') for game in games])
+            for index in range(options['questions']):
+                await phase('answer_ws', [self.answer_ws(game, index) for game in games])
+                await phase('answer_http', [self.answer_http(game, index, semaphore)
+                                            for game in games])
+                if index + 1 < options['questions']:
+                    await phase('advance', [
+                        self.fan_out(game, 'next_question', 'new_question', question_index=index)
+                        for game in games
+                    ])
+            for game in games:
+                for communicator in game['host_sockets'] + game['sockets']:
+                    await communicator.disconnect()
+        finally:
+            await sync_to_async(counter.uninstall)()
+
+        summary = {}
+        for name, _ in PHASES:
+            result = results.get(name)
+            if result is None or not result['samples']:
+                continue
+            samples = sorted(result['samples'])
+            summary[name] = {
+                'ops': len(samples),
+                'p50_ms': round(statistics.median(samples) * 1000, 3),
+                'p99_ms': round(samples[max(0, int(len(samples) * 0.99) - 1)] * 1000, 3),
+                'per_second': round(len(samples) / result['elapsed'], 1),
+                'queries_per_op': round(result['queries'] / len(samples), 3),
+            }
+        return summary
+
+    async def join(self, game, semaphore):
+        async def one(client, n):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    '/api/join-quiz/',
+                    {'name': f'player {n}', 'game_code': game['code']},
+                    content_type='application/json'
+                )
+                elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise CommandError(f'join rejected: {response.content!r}')
+            return elapsed
+        return await asyncio.gather(*(one(c, n) for n, c in enumerate(game['clients'])))
+
+    async def connect(self, game, application):
+        path = f"/ws/game/{game['code']}/"
+
+        async def open_socket(client, announce):
+            cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+            communicator = WebsocketCommunicator(
+                application, path, headers=[(b'cookie', cookie.encode())]
+            )
+            started = time.perf_counter()
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise CommandError('socket was rejected')
+            if announce:
+                await communicator.send_to(text_data=json.dumps({'type': 'player_joined'}))
+            return communicator, time.perf_counter() - started
+
+        hosts = await asyncio.gather(*(open_socket(c, False) for c in game['hosts']))
+        game['host_sockets'] = [communicator for communicator, _ in hosts]
+        for communicator in game['host_sockets']:
+            await communicator.send_to(text_data=json.dumps({'type': 'roster_subscribe'}))
+        players = await asyncio.gather(*(open_socket(c, True) for c in game['clients']))
+        game['sockets'] = [communicator for communicator, _ in players]
+        return [elapsed for _, elapsed in players]
+
+    async def fan_out(self, game, command, frame_type, **fields):
+        # The first host drives; every player socket times its own delivery
+        started = time.perf_counter()
+        await game['host_sockets'][0].send_to(text_data=json.dumps({'type': command, **fields}))
+
+        async def delivered(communicator):
+            await expect(communicator, frame_type)
+            return time.perf_counter() - started
+        return await asyncio.gather(*(delivered(c) for c in game['sockets']))
+
+    async def answer_ws(self, game, index):
+        async def one(communicator, n):
+            started = time.perf_counter()
+            await communicator.send_to(text_data=json.dumps({
+                'type': 'submit_answer', 'question_index': index, 'selected_answer': n % 4
+            }))
+            result = await expect(communicator, 'answer_result')
+            if 'error' in result:
+                raise CommandError(f"answer rejected: {result['error']}")
+            return time.perf_counter() - started
+        sockets = game['sockets'][game['http_players']:]
+        return await asyncio.gather(*(one(c, n) for n, c in enumerate(sockets)))
+
+    async def answer_http(self, game, index, semaphore):
+        async def one(client, n):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    '/api/submit-answer/',
+                    {'question_index': index, 'selected_answer': n % 4},
+                    content_type='application/json'
+                )
+                elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise CommandError(f'answer rejected: {response.content!r}')
+            return elapsed
+        clients = game['clients'][:game['http_players']]
+        return await asyncio.gather(*(one(c, n) for n, c in enumerate(clients)))
+
+    def report(self, results):
+        self.stdout.write(f"{'phase':<12} {'ops':>6} {'p50 ms':>8} {'p99 ms':>8} "
+                          f"{'ops/s':>9} {'queries/op':>10}")
+        for name, description in PHASES:
+            result = results.get(name)
+            if result is None:
+                continue
+            self.stdout.write(
+                f"{name:<12} {result['ops']:>6} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                f"{result['per_second']:>9,.0f} {result['queries_per_op']:>10.2f}  {description}"
+            )
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for name, base in baseline.items():
+            result = results.get(name)
+            if result is None:
+                regressions.append(f'{name}: missing from this run')
+                continue
+            if result['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+                regressions.append(f"{name}: p99 {result['p99_ms']:.2f} ms, "
+                                   f"baseline {base['p99_ms']:.2f} ms")
+            if result['per_second'] < base['per_second'] * (1 - tolerance):
+                regressions.append(f"{name}: {result['per_second']:,.0f} ops/s, "
+                                   f"baseline {base['per_second']:,.0f}")
+            # Query counts are deterministic: any increase is a regression
+            if result['queries_per_op'] > base['queries_per_op']:
+                regressions.append(f"{name}: {result['queries_per_op']} queries per op, "
+                                   f"baseline {base['queries_per_op']}")
+        return regressions
+
+
+async def expect(communicator, frame_type):
+    # Skip the frames a socket gets in between (roster, leaderboard, ranks)
+    while True:
+        frame = json.loads(await communicator.receive_from(timeout=30))
+        if frame['type'] == frame_type:
+            return frame
@@ -0,0 +1,193 @@
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from quiz import analytics
+from quiz.compiled import get_compiled_quiz
+from quiz.models import AnswerChunk, GameSession, Player, SessionArchive
+
+LIVE_MODELS = [GameSession, Player, AnswerChunk]
+
+
+class Command(BaseCommand):
+    help = (
+        'Roll finished sessions into SessionArchive and delete them with their '
+        'players and answers, and delete old sessions nobody joined; one short '
+        'transaction per batch'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=30,
+                            help='Archive sessions finished more than this many days ago')
+        parser.add_argument('--empty-days', type=float, default=7,
+                            help='Delete sessions without players created more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches, to leave room for live traffic')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count what would be archived and deleted')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        cutoff = now - timedelta(days=options['days'])
+        # Sessions finished before ended_at was recorded go by their creation
+        finished = GameSession.objects.filter(status='FINISHED').filter(
+            Q(ended_at__lt=cutoff) | Q(ended_at__isnull=True, created_at__lt=cutoff)
+        )
+        # Never a running game: those are ACTIVE, and have players anyway
+        empty = GameSession.objects.filter(
+            created_at__lt=now - timedelta(days=options['empty_days'])
+        ).exclude(status='ACTIVE').exclude(
+            Exists(Player.objects.filter(session=OuterRef('pk')))
+        )
+        if options['dry_run']:
+            self.stdout.write(f'{finished.count()} finished sessions to archive, '
+                              f'{empty.count()} empty sessions to delete')
+            return
+
+        before = table_sizes()
+        removed = Counter()
+        archived = 0
+        for ids in self.batches(finished, options):
+            with transaction.atomic():
+                # Re-read under the transaction; a batch is a few queries long
+                archived += self.archive(finished.filter(id__in=ids))
+                removed.update(delete_sessions(finished.filter(id__in=ids)))
+        for ids in self.batches(empty, options):
+            with transaction.atomic():
+                removed.update(delete_sessions(empty.filter(id__in=ids)))
+        after = table_sizes()
+
+        self.stdout.write(f'archived {archived} sessions')
+        self.stdout.write(f"{'table':<24} {'rows removed':>12} {'bytes before':>14} {'bytes after':>14}")
+        for model in LIVE_MODELS + [SessionArchive]:
+            table = model._meta.db_table
+            self.stdout.write(
+                f"{table:<24} {removed.get(model._meta.label, 0):>12} "
+                f"{format_bytes(before.get(table)):>14} {format_bytes(after.get(table)):>14}"
+            )
+        if before and after:
+            live = [model._meta.db_table for model in LIVE_MODELS]
+            reclaimed = sum(before[t] for t in live) - sum(after[t] for t in live)
+            grown = after[SessionArchive._meta.db_table] - before[SessionArchive._meta.db_table]
+            self.stdout.write(self.style.SUCCESS(
+                f'reclaimed {format_bytes(reclaimed)} from live tables, '
+                f'archive grew {format_bytes(grown)}'
+            ))
+        if connection.vendor == 'postgresql':
+            self.stdout.write('PostgreSQL hands freed space back to the tables at the next VACUUM')
+
+    def batches(self, queryset, options):
+        # Keyset pagination: each batch is its own short query, no open cursor
+        last_id = 0
+        while True:
+            ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list(
+                'id', flat=True
+            )[:options['batch_size']])
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+            if options['pause']:
+                time.sleep(options['pause'])
+
+    def archive(self, sessions):
+        sessions = list(sessions.values(
+            'id', 'quiz_id', 'quiz__title', 'game_code', 'started_at', 'ended_at'
+        ))
+        ids = [session['id'] for session in sessions]
+        scores = defaultdict(list)
+        for session_id, name, score in Player.objects.filter(session_id__in=ids).order_by(
+            'session_id', '-score', 'joined_at'
+        ).values_list('session_id', 'name', 'score'):
+            scores[session_id].append([name, score])
+        chunks = defaultdict(list)
+        for session_id, count, data in AnswerChunk.objects.filter(session_id__in=ids).order_by(
+            'id'
+        ).values_list('session_id', 'count', 'data'):
+            chunks[session_id].append((count, data))
+
+        archives = []
+        for session in sessions:
+            ranking = scores[session['id']]
+            points = [score for _, score in ranking]
+            questions = []
+            answer_count = sum(count for count, _ in chunks[session['id']])
+            compiled = get_compiled_quiz(session['quiz_id'])
+            if answer_count and compiled is not None:
+                columns = analytics.decode_chunks(chunks[session['id']])
+                report = analytics.report(columns, compiled, hardest=0)
+                questions = [
+                    [question['answers'], question['accuracy'], question['latency']['p50']]
+                    for question in report['questions']
+                ]
+            archives.append(SessionArchive(
+                session_id=session['id'],
+                quiz_id=session['quiz_id'],
+                game_code=session['game_code'],
+                title=session['quiz__title'],
+                started_at=session['started_at'],
+                ended_at=session['ended_at'],
+                player_count=len(ranking),
+                answer_count=answer_count,
+                top_score=max(points, default=0),
+                mean_score=sum(points) / len(points) if points else 0.0,
+                scores=ranking,
+                questions=questions,
+            ))
+        # A rerun after an interrupted batch finds its archives already there
+        SessionArchive.objects.bulk_create(archives, ignore_conflicts=True)
+        return len(archives)
+
+
+def delete_sessions(sessions):
+    # Children first, each one DELETE ... WHERE session_id IN (...)
+    ids = list(sessions.values_list('id', flat=True))
+    removed = Counter()
+    for queryset in (AnswerChunk.objects.filter(session_id__in=ids),
+                     Player.objects.filter(session_id__in=ids),
+                     GameSession.objects.filter(id__in=ids)):
+        _, per_model = queryset.delete()
+        removed.update(per_model)
+    return removed
+
+
+def table_sizes():
+    """Bytes per table (with its indexes), or {} when the database can't say."""
+    tables = [model._meta.db_table for model in LIVE_MODELS + [SessionArchive]]
+    sizes = {}
+    try:
+        with connection.cursor() as cursor:
+            for table in tables:
+                if connection.vendor == 'sqlite':
+                    # Needs SQLite built with the dbstat table (the default
+                    # for Python's bundled library)
+                    cursor.execute(
+                        'SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN '
+                        '(SELECT name FROM sqlite_master WHERE tbl_name = %s)', [table]
+                    )
+                elif connection.vendor == 'postgresql':
+                    cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+                else:
+                    return {}
+                sizes[table] = cursor.fetchone()[0]
+    except DatabaseError:
+        return {}
+    return sizes
+
+
+def format_bytes(size):
+    if size is None:
+        return '-'
+    if abs(size) < 1024:
+        return f'{size} B'
+    for unit in ('KiB', 'MiB'):
+        size /= 1024
+        if abs(size) < 1024:
+            return f'{size:,.1f} {unit}'
+    return f'{size / 1024:,.1f} GiB'
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.importer import import_quizzes, iter_json_records
+
+
+class Command(BaseCommand):
+    help = 'Bulk import quizzes from a JSON array or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for stdin')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--time-per-question', type=int, default=30)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Validate only, do not insert anything'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        path = options['path']
+        try:
+            stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(f'Cannot open {path}: {exc}')
+
+        with stream:
+            stats = import_quizzes(
+                iter_json_records(stream),
+                batch_size=options['batch_size'],
+                default_time_per_question=options['time_per_question'],
+                dry_run=options['dry_run']
+            )
+
+        for number, message in stats['errors']:
+            self.stderr.write(f'record {number}: {message}')
+        verb = 'validated' if options['dry_run'] else 'imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['imported']} quizzes {verb}, {stats['rejected']} rejected "
+            f"in {stats['seconds']:.2f}s ({stats['rows_per_second']:,.0f} rows/s)"
+        ))
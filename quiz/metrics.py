@@ -0,0 +1,293 @@
+"""Process metrics for the hot paths, in Prometheus text format.
+
+``MetricsMiddleware`` times every HTTP request by view name and
+``MetricsConsumerMixin`` every socket message by its ``type``; both
+record the database queries run on the request's or message's behalf
+(on whatever thread: the context is carried into ``sync_to_async``
+calls), the payload sizes, and active sockets per game. ``/metrics``
+renders the registry.
+
+With ``QUIZ_METRICS_SAMPLE`` below 1 only that share of requests and
+messages is measured; the rest cost one random draw. Histogram counts
+are then samples: divide by ``quiz_metrics_sample_rate``.
+"""
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+ENABLED = getattr(settings, 'QUIZ_METRICS', True)
+SAMPLE_RATE = getattr(settings, 'QUIZ_METRICS_SAMPLE', 1.0)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, labels, value):
+        with self.lock:
+            self.values[labels] = value
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            value = self.values.get(labels, 0) + amount
+            # Series that drop to zero go away, so per-game labels don't
+            # pile up after the games end
+            if value:
+                self.values[labels] = value
+            else:
+                self.values.pop(labels, None)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, labels, value):
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                entry = self.values[labels] = [0] * len(self.buckets) + [0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            items = sorted((labels, list(entry)) for labels, entry in self.values.items())
+        for labels, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            le = _labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{le} {entry[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {entry[-2]}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {entry[-1]}')
+        return lines
+
+
+http_seconds = Histogram('quiz_http_request_seconds', 'HTTP request latency.', ('view',))
+http_queries = Histogram('quiz_http_request_queries', 'DB queries per HTTP request.',
+                         ('view',), QUERY_BUCKETS)
+http_db_seconds = Counter('quiz_http_db_seconds_total', 'Time spent in DB queries.', ('view',))
+http_response_bytes = Histogram('quiz_http_response_bytes', 'HTTP response body size.',
+                                ('view',), SIZE_BUCKETS)
+ws_seconds = Histogram('quiz_ws_message_seconds', 'Socket message handling latency.', ('type',))
+ws_queries = Histogram('quiz_ws_message_queries', 'DB queries per socket message.',
+                       ('type',), QUERY_BUCKETS)
+ws_db_seconds = Counter('quiz_ws_db_seconds_total', 'Time spent in DB queries.', ('type',))
+ws_received_bytes = Histogram('quiz_ws_received_bytes', 'Socket message size.',
+                              ('type',), SIZE_BUCKETS)
+ws_sent_frames = Counter('quiz_ws_sent_frames_total', 'Frames sent to sockets.')
+ws_sent_bytes = Counter('quiz_ws_sent_bytes_total', 'Frame bytes sent to sockets.')
+ws_dropped = Counter('quiz_ws_dropped_sockets_total', 'Sockets closed for falling behind.')
+ws_active = Gauge('quiz_ws_active_sockets', 'Open game sockets.', ('game',))
+sample_rate = Gauge('quiz_metrics_sample_rate', 'Share of requests and messages measured.')
+sample_rate.set((), SAMPLE_RATE)
+
+
+class Measurement:
+    """What one request or message did; filled in by the query wrapper."""
+    __slots__ = ('label', 'queries', 'db_seconds')
+
+    def __init__(self):
+        self.label = None
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_current = ContextVar('quiz_metrics_measurement', default=None)
+
+
+def sampled():
+    return ENABLED and (SAMPLE_RATE >= 1 or random.random() < SAMPLE_RATE)
+
+
+def set_label(label):
+    # Called by the consumer once it knows the message type
+    measurement = _current.get()
+    if measurement is not None:
+        measurement.label = label
+
+
+def count_queries(execute, sql, params, many, context):
+    measurement = _current.get()
+    if measurement is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        measurement.db_seconds += time.perf_counter() - started
+        measurement.queries += 1
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+if ENABLED:
+    connection_created.connect(install_query_wrapper)
+
+
+class MetricsMiddleware:
+    """Latency, queries and response size per view.
+
+    Runs in whichever mode the chain below it does, so async views stay
+    on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not sampled():
+            return self.get_response(request)
+        measurement = Measurement()
+        token = _current.set(measurement)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+        return self.record(request, response, measurement, elapsed)
+
+    async def __acall__(self, request):
+        if not sampled():
+            return await self.get_response(request)
+        measurement = Measurement()
+        token = _current.set(measurement)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+        return self.record(request, response, measurement, elapsed)
+
+    def record(self, request, response, measurement, elapsed):
+        match = request.resolver_match
+        labels = (match.url_name or match.view_name if match else 'unresolved',)
+        http_seconds.observe(labels, elapsed)
+        http_queries.observe(labels, measurement.queries)
+        http_db_seconds.inc(labels, measurement.db_seconds)
+        if not response.streaming:
+            http_response_bytes.observe(labels, len(response.content))
+        return response
+
+
+class MetricsConsumerMixin:
+    """Per-message metrics for a websocket consumer.
+
+    The consumer names each message with ``metrics.set_label(type)``;
+    ``metrics_group`` is the attribute holding the socket's game.
+    """
+    metrics_group = 'game_code'
+
+    async def websocket_connect(self, message):
+        await super().websocket_connect(message)
+        if ENABLED:
+            ws_active.inc((getattr(self, self.metrics_group, ''),))
+
+    async def websocket_disconnect(self, message):
+        if ENABLED:
+            ws_active.inc((getattr(self, self.metrics_group, ''),), -1)
+        await super().websocket_disconnect(message)
+
+    async def websocket_receive(self, message):
+        if not sampled():
+            return await super().websocket_receive(message)
+        measurement = Measurement()
+        token = _current.set(measurement)
+        started = time.perf_counter()
+        try:
+            await super().websocket_receive(message)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            labels = (measurement.label or 'unknown',)
+            ws_seconds.observe(labels, elapsed)
+            ws_queries.observe(labels, measurement.queries)
+            ws_db_seconds.inc(labels, measurement.db_seconds)
+            payload = message.get('text') or message.get('bytes') or ''
+            ws_received_bytes.observe(labels, len(payload))
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if sampled():
+            ws_sent_frames.inc()
+            # Characters for text frames: exact for the ASCII JSON we send
+            ws_sent_bytes.inc((), len(text_data if text_data is not None else bytes_data or b''))
+        await super().send(text_data, bytes_data, close)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
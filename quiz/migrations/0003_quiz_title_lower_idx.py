@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:34
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0002_game_code_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='quiz_title_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_game_codes(apps, schema_editor):
+    GameSession = apps.get_model('quiz', 'GameSession')
+    Quiz = apps.get_model('quiz', 'Quiz')
+    GameSession.objects.update(game_code=Subquery(
+        Quiz.objects.filter(id=OuterRef('quiz_id')).values('game_code')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0003_quiz_title_lower_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='game_code',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=6),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_game_codes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['session', 'score'], name='player_session_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['session', 'joined_at'], name='player_session_joined_idx'),
+        ),
+    ]
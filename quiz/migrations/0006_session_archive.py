@@ -0,0 +1,42 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0005_answer_chunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(fields=['status', 'ended_at'], name='session_status_ended_idx'),
+        ),
+        migrations.CreateModel(
+            name='SessionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.BigIntegerField(unique=True)),
+                ('game_code', models.CharField(db_index=True, max_length=6)),
+                ('title', models.CharField(max_length=200)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('player_count', models.PositiveIntegerField()),
+                ('answer_count', models.PositiveIntegerField()),
+                ('top_score', models.IntegerField()),
+                ('mean_score', models.FloatField()),
+                ('scores', models.JSONField()),
+                ('questions', models.JSONField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('quiz', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archives', to='quiz.quiz')),
+            ],
+        ),
+    ]
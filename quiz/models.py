@@ -1,10 +1,10 @@
-from django.db import models
-import json
-import qrcode
-from io import BytesIO
-from django.core.files import File
-import random
-import string
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Lower
+from django.urls import reverse
+from .codes import allocate_game_code, allocate_game_codes
+from .compiled import invalidate_compiled_quiz, store_compiled_quiz
+from .listing import invalidate_quiz_listing
+from .qr import join_url, prewarm_qr, url_version
 
 class Quiz(models.Model):
     title = models.CharField(max_length=200)
@@ -19,40 +19,70 @@ class Quiz(models.Model):
     time_per_question = models.IntegerField(default=30)
     max_players = models.IntegerField(default=100)
     
+    class Meta:
+        indexes = [
+            # Backs the case-insensitive title prefix search of /api/quizzes/
+            models.Index(Lower('title'), name='quiz_title_lower_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
-        if not self.game_code:
+        # Compiled after the row is written: a malformed quiz must never get there
+        from .importer import validate_quiz
+        validate_quiz(self.quiz_data)
+        creating = self._state.adding
+        if self.game_code:
+            super().save(*args, **kwargs)
+        else:
+            self._save_with_new_code(*args, **kwargs)
+        # Rebuilt on every save so edits never serve a stale answer key
+        store_compiled_quiz(self)
+        invalidate_quiz_listing()
+        if creating:
+            # Off the request path; the QR endpoint renders on demand if needed
+            prewarm_qr(self.game_code)
+
+    def delete(self, *args, **kwargs):
+        quiz_id = self.id
+        result = super().delete(*args, **kwargs)
+        invalidate_compiled_quiz(quiz_id)
+        invalidate_quiz_listing()
+        return result
+    
+    def _save_with_new_code(self, *args, **kwargs):
+        # Allocated codes are unique among themselves; the insert only fails
+        # if the code was taken by an older, randomly generated one
+        for attempt in range(5):
             self.game_code = self.generate_game_code()
-        super().save(*args, **kwargs)
-        if not self.qr_code:
-            self.generate_qr_code()
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if Quiz.objects.filter(game_code=self.game_code).exists() and attempt < 4:
+                    continue
+                self.game_code = ''
+                raise
     
     def generate_game_code(self):
-        while True:
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-            if not Quiz.objects.filter(game_code=code).exists():
-                return code
+        return allocate_game_code()
+    
+    @classmethod
+    def generate_game_codes(cls, count):
+        return allocate_game_codes(count)
     
-    def generate_qr_code(self):
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        join_url = f"http://localhost:8000/join/{self.game_code}/"
-        qr.add_data(join_url)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        self.qr_code.save(
-            f'qr_{self.game_code}.png',
-            File(buffer),
-            save=False
-        )
-        self.save()
+    @property
+    def qr_code_url(self):
+        # Versioned by join URL so the long-lived browser cache stays correct
+        version = url_version(join_url(self.game_code))
+        return f"{reverse('quiz_qr', args=[self.game_code])}?v={version}"
     
     def __str__(self):
         return f"{self.title} - {self.game_code}"
 
+class GameCodeSequence(models.Model):
+    """Single-row counter behind the game code allocator (see codes.py)."""
+    next_value = models.BigIntegerField(default=0)
+
 class GameSession(models.Model):
     STATUS_CHOICES = [
         ('WAITING', 'Waiting'),
@@ -61,11 +91,26 @@ class GameSession(models.Model):
     ]
     
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    # Copy of quiz.game_code (which never changes), so lookups by code
+    # don't join through Quiz
+    game_code = models.CharField(max_length=6, db_index=True, editable=False)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='WAITING')
     current_question_index = models.IntegerField(default=0)
     started_at = models.DateTimeField(null=True, blank=True)
     ended_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Finished sessions by age, for compact_sessions
+            models.Index(fields=['status', 'ended_at'], name='session_status_ended_idx'),
+        ]
     
+    def save(self, *args, **kwargs):
+        if not self.game_code:
+            self.game_code = self.quiz.game_code
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Session for {self.quiz.title}"
 
@@ -77,6 +122,41 @@ class Player(models.Model):
 
     class Meta:
         unique_together = ['session', 'name']
+        indexes = [
+            # Leaderboard (by score) and lobby (by join time) of one session
+            models.Index(fields=['session', 'score'], name='player_session_score_idx'),
+            models.Index(fields=['session', 'joined_at'], name='player_session_joined_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.score}"
+
+class AnswerChunk(models.Model):
+    """A batch of a session's answers in columnar form (see answers.py)."""
+    session = models.ForeignKey(GameSession, on_delete=models.CASCADE, related_name='answer_chunks')
+    count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.count} answers for session {self.session_id}"
+
+class SessionArchive(models.Model):
+    """What is kept of a finished session once compact_sessions removes it."""
+    # Id the session had; its players and answers are gone
+    session_id = models.BigIntegerField(unique=True)
+    quiz = models.ForeignKey(Quiz, null=True, on_delete=models.SET_NULL, related_name='archives')
+    game_code = models.CharField(max_length=6, db_index=True)
+    title = models.CharField(max_length=200)
+    started_at = models.DateTimeField(null=True, blank=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+    player_count = models.PositiveIntegerField()
+    answer_count = models.PositiveIntegerField()
+    top_score = models.IntegerField()
+    mean_score = models.FloatField()
+    scores = models.JSONField()  # [[name, score], ...], best first
+    questions = models.JSONField()  # [[answers, accuracy, p50 latency], ...]
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive of session {self.session_id} ({self.game_code})"
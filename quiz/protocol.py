@@ -0,0 +1,137 @@
+"""Compact wire protocol for game sockets.
+
+Clients that open the socket with the ``quizmaster.msgpack.v1`` subprotocol
+get binary msgpack frames instead of JSON text. Every frame is an array
+whose first item is an integer message type:
+
+    game_started    [20, seq, index, time_limit, questions]
+    new_question    [21, seq, index]
+    game_ended      [22, seq]
+    leaderboard     [23, seq, total_players, [[rank, id, name, score], ...]]
+    my_rank         [24, rank, score, total_players]
+    quiz            [28, seq, index, time_limit, questions]
+    answer_distribution
+                    [30, index, [count, ...], answered, total_players, final]
+    anything else   [code, {field: value, ...}]
+
+``seq`` is the frame's number in the game's event log (see events.py);
+``quiz`` carries the latest one, to resume from.
+
+``questions`` is the whole quiz as ``[[question, options], ...]``: it goes
+out once with ``game_started`` (or on request with ``quiz`` for a socket
+that connects mid-game), so question frames only carry the index.
+
+Client messages are ``[code]`` or ``[code, {field: value, ...}]`` with
+the codes in ``CLIENT_TYPES``; JSON clients are unchanged. Clients that
+send ``ack`` with the last ``seq`` they handled are closed (4008) once
+they fall too far behind, and resume after reconnecting.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+import msgpack
+
+SUBPROTOCOL = 'quizmaster.msgpack.v1'
+
+CLIENT_TYPES = {
+    1: 'start_game',
+    2: 'next_question',
+    3: 'end_game',
+    4: 'player_joined',
+    5: 'submit_answer',
+    6: 'roster_subscribe',
+    7: 'get_quiz',
+    8: 'resume',
+    9: 'ack',
+}
+
+SERVER_CODES = {
+    'game_started': 20,
+    'new_question': 21,
+    'game_ended': 22,
+    'leaderboard': 23,
+    'my_rank': 24,
+    'answer_result': 25,
+    'roster_snapshot': 26,
+    'roster_delta': 27,
+    'quiz': 28,
+    'snapshot': 29,
+    'answer_distribution': 30,
+}
+
+# Compact copies of shared JSON frames, so a broadcast is converted once
+# per process rather than once per socket
+_converted = OrderedDict()
+_lock = threading.Lock()
+CONVERTED_SIZE = 256
+
+
+def pack_questions(compiled):
+    return msgpack.packb([[p['question'], p['options']] for p in compiled.payloads])
+
+
+def quiz_frame(message_type, seq, index, compiled):
+    """Question index plus the whole quiz, for game start and late joiners."""
+    # The packed questions are shared: only the header items are new
+    head = msgpack.packb([SERVER_CODES[message_type], seq, index, compiled.time_per_question])
+    # Same array with a fifth item: fixarray header 0x94 -> 0x95
+    return b'\x95' + head[1:] + compiled.packed_questions()
+
+
+def encode(frame):
+    """Compact encoding of a frame dict (with a ``type``)."""
+    message_type = frame['type']
+    code = SERVER_CODES.get(message_type, 0)
+    seq = frame.get('seq')
+    if message_type == 'new_question':
+        return msgpack.packb([code, seq, frame['question']['index']])
+    if message_type == 'game_ended':
+        return msgpack.packb([code, seq])
+    if message_type == 'leaderboard':
+        top = [[e['rank'], e['id'], e['name'], e['score']] for e in frame['top']]
+        return msgpack.packb([code, seq, frame['total_players'], top])
+    if message_type == 'answer_distribution':
+        return msgpack.packb([code, frame['question_index'], frame['counts'], frame['answered'],
+                              frame['total_players'], frame['final']])
+    if message_type == 'my_rank':
+        return msgpack.packb([code, frame['rank'], frame['score'], frame['total_players']])
+    payload = {key: value for key, value in frame.items() if key != 'type'}
+    if not code:
+        payload['type'] = message_type
+    return msgpack.packb([code, payload])
+
+
+def convert(text):
+    """Compact form of a pre-serialized JSON frame."""
+    with _lock:
+        data = _converted.get(text)
+        if data is not None:
+            _converted.move_to_end(text)
+            return data
+    data = encode(json.loads(text))
+    with _lock:
+        _converted[text] = data
+        while len(_converted) > CONVERTED_SIZE:
+            _converted.popitem(last=False)
+    return data
+
+
+def decode(data):
+    """Client message bytes -> the dict a JSON client would have sent.
+
+    Returns None for anything malformed.
+    """
+    try:
+        message = msgpack.unpackb(data)
+    except (ValueError, msgpack.UnpackException):
+        return None
+    if not isinstance(message, list) or not 1 <= len(message) <= 2:
+        return None
+    if not isinstance(message[0], int):
+        return None
+    message_type = CLIENT_TYPES.get(message[0])
+    payload = message[1] if len(message) == 2 else {}
+    if message_type is None or not isinstance(payload, dict):
+        return None
+    return {**payload, 'type': message_type}
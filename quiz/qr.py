@@ -0,0 +1,54 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import qrcode
+from django.conf import settings
+from django.core.cache import cache
+
+# Rendering is CPU-bound Pillow work, a couple of threads is plenty
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='quiz-qr')
+CACHE_TIMEOUT = 30 * 24 * 60 * 60
+
+
+def join_url(game_code):
+    return f"{settings.QUIZ_JOIN_BASE_URL.rstrip('/')}/join/{game_code}/"
+
+
+def url_version(url):
+    # Short fingerprint of the join URL, used for cache keys and cache busting
+    return hashlib.sha1(url.encode()).hexdigest()[:12]
+
+
+def render_qr_png(url):
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(url)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _cache_key(game_code):
+    return f'quiz:qr:{url_version(join_url(game_code))}'
+
+
+def cached_qr_png(game_code):
+    """PNG bytes if already rendered for the current join URL, else None."""
+    return cache.get(_cache_key(game_code))
+
+
+def get_qr_png(game_code):
+    """PNG bytes of the join QR code, rendered at most once per join URL."""
+    png = cached_qr_png(game_code)
+    if png is None:
+        png = render_qr_png(join_url(game_code))
+        cache.set(_cache_key(game_code), png, CACHE_TIMEOUT)
+    return png
+
+
+def prewarm_qr(game_code):
+    """Render the QR code in the background so the first view is a cache hit."""
+    _executor.submit(get_qr_png, game_code)
@@ -0,0 +1,56 @@
+"""In-memory gates in front of answer scoring.
+
+Both are O(1) per answer and touch nothing but the game's own memory, so
+a client replaying or flooding answers is turned away before any scoring
+or database work.
+"""
+from django.conf import settings
+
+PLAYER_RATE = getattr(settings, 'QUIZ_PLAYER_ANSWER_RATE', 2.0)
+PLAYER_BURST = getattr(settings, 'QUIZ_PLAYER_ANSWER_BURST', 5)
+GAME_RATE = getattr(settings, 'QUIZ_GAME_ANSWER_RATE', 2000.0)
+GAME_BURST = getattr(settings, 'QUIZ_GAME_ANSWER_BURST', 5000)
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``."""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = now
+
+    def take(self, now):
+        tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+
+class AnswerBitmap:
+    """One bit per (player, question): set once the answer has been scored.
+
+    Players get dense slots in arrival order; each question has its own
+    bit array, grown a byte at a time as players join.
+    """
+
+    def __init__(self, questions):
+        self.slots = {}
+        self.bits = [bytearray() for _ in range(questions)]
+
+    def test_and_set(self, player_id, question_index):
+        """Mark the answer; False if it was already marked."""
+        slot = self.slots.setdefault(player_id, len(self.slots))
+        bits = self.bits[question_index]
+        byte, mask = slot >> 3, 1 << (slot & 7)
+        if byte >= len(bits):
+            bits.extend(bytes(byte + 1 - len(bits)))
+        elif bits[byte] & mask:
+            return False
+        bits[byte] |= mask
+        return True
@@ -0,0 +1,493 @@
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import dispatch, events, flow, game_state, ingest, tokens
+from .broadcast import encode_frame, send_frame
+from .consumers import CLOSE_TOO_SLOW, MAX_UNACKED
+from .db import on_pool_threads
+from .flush import write_behind
+from .models import GameSession, Player, Quiz, SessionArchive
+from .ratelimit import PLAYER_BURST, AnswerBitmap, TokenBucket
+
+MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+class CaptureEngineQueries:
+    """``CaptureQueriesContext`` over this thread and the engine's DB pool.
+
+    Game loads and socket commands run their queries on the pool threads
+    (see db.py), where a plain ``assertNumQueries`` does not look.
+    """
+
+    def __init__(self):
+        self.contexts = []
+
+    def __enter__(self):
+        self.contexts.append(CaptureQueriesContext(connection).__enter__())
+        on_pool_threads(lambda: self.contexts.append(
+            CaptureQueriesContext(connections['default']).__enter__()
+        ))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for context in self.contexts:
+            context.__exit__(exc_type, exc_value, traceback)
+
+    @property
+    def captured_queries(self):
+        return [query for context in self.contexts for query in context.captured_queries]
+
+    def __len__(self):
+        return len(self.captured_queries)
+
+
+# Transactions of a TestCase would hide its rows from the pool threads
+@override_settings(CHANNEL_LAYERS=MEMORY_LAYER)
+class QueryBudgetTests(TransactionTestCase):
+    """Most queries each game endpoint may run once the game is live.
+
+    Session reads by the session middleware count; write-behind flushes
+    are kept out by not starting the background thread.
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(write_behind, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.quiz = Quiz.objects.create(
+            title='Query budgets', time_per_question=3600,
+            quiz_data={'questions': [
+                {'question': 'Ready?', 'options': ['Yes', 'No'], 'correct_answer': 0}
+            ] * 2}
+        )
+        self.code = self.quiz.game_code
+        self.session = GameSession.objects.create(quiz=self.quiz)
+        player = Player.objects.create(session=self.session, name='player')
+        self.player = Client()
+        player_session = self.player.session
+        player_session['player_id'] = player.id
+        player_session.save()
+        token_player = Player.objects.create(session=self.session, name='token player')
+        self.token = tokens.issue(token_player.id, self.session.id, self.code)
+        self.host = Client()
+        host_session = self.host.session
+        host_session['is_quiz_host'] = self.code
+        host_session.save()
+        # Cold start: the first request loads the game into memory
+        self.host.get(f'/host/{self.code}/')
+
+    def tearDown(self):
+        write_behind.flush_now()
+        game_state.drop_game(self.code)
+
+    def assertEngineQueries(self, num, method, path, client=None, **kwargs):
+        client = client or self.host
+        with CaptureEngineQueries() as captured:
+            response = getattr(client, method)(path, **kwargs)
+        self.assertLess(response.status_code, 400)
+        queries = '\n'.join(query['sql'] for query in captured.captured_queries)
+        self.assertLessEqual(
+            len(captured), num, f'{len(captured)} queries, budget {num}:\n{queries}'
+        )
+        return response
+
+    def answer(self, client, budget):
+        return self.assertEngineQueries(
+            budget, 'post', '/api/submit-answer/', client,
+            data={'question_index': 0, 'selected_answer': 0},
+            content_type='application/json'
+        )
+
+    def test_host_game(self):
+        self.assertEngineQueries(3, 'get', f'/host/{self.code}/')
+
+    def test_api_players(self):
+        self.assertEngineQueries(0, 'get', f'/api/players/{self.code}/')
+
+    def test_api_start_game(self):
+        self.assertEngineQueries(0, 'post', f'/api/start-game/{self.code}/')
+
+    def test_submit_answer(self):
+        self.host.post(f'/api/start-game/{self.code}/')
+        self.answer(self.player, 1)
+
+    def test_submit_answer_token(self):
+        # The signed token names the player: no session read, no query
+        self.host.post(f'/api/start-game/{self.code}/')
+        client = Client()
+        client.cookies[tokens.COOKIE_NAME] = self.token
+        response = self.answer(client, 0)
+        self.assertNotIn('error', response.json())
+
+    def test_submit_answer_token_header(self):
+        self.host.post(f'/api/start-game/{self.code}/')
+        response = self.answer(Client(HTTP_X_PLAYER_TOKEN=self.token), 0)
+        self.assertNotIn('error', response.json())
+
+    def test_socket_answer_token(self):
+        # Connect and answer, session middleware included
+        self.host.post(f'/api/start-game/{self.code}/')
+        with CaptureEngineQueries() as captured:
+            frame = async_to_sync(self.answer_over_socket)()
+        self.assertNotIn('error', frame)
+        self.assertEqual(len(captured), 0, captured.captured_queries)
+
+    async def answer_over_socket(self):
+        from quiz_app.asgi import application
+
+        socket = WebsocketCommunicator(application, f'/ws/game/{self.code}/?token={self.token}')
+        await socket.connect()
+        await socket.send_json_to({'type': 'submit_answer', 'question_index': 0, 'selected_answer': 0})
+        while True:
+            frame = await socket.receive_json_from()
+            if frame['type'] == 'answer_result':
+                break
+        await socket.disconnect()
+        return frame
+
+    def test_api_leaderboard(self):
+        self.assertEngineQueries(0, 'get', f'/api/leaderboard/{self.code}/')
+
+    def test_api_next_question(self):
+        self.host.post(f'/api/start-game/{self.code}/')
+        self.assertEngineQueries(0, 'post', f'/api/next-question/{self.code}/')
+
+    def test_api_end_game(self):
+        self.host.post(f'/api/start-game/{self.code}/')
+        self.assertEngineQueries(0, 'post', f'/api/end-game/{self.code}/')
+
+
+class EventLogTests(SimpleTestCase):
+    def restored_log(self, seqs):
+        # xrevrange: newest first
+        rows = [(b'0-0', {b'seq': seq, b'text': f'{{"seq": {seq}}}'.encode(), b'compact': b''})
+                for seq in reversed(seqs)]
+        log = events.EventLog(session_id=1)
+        with mock.patch.object(events, 'redis_client') as client:
+            client.return_value.xrevrange.return_value = rows
+            log.restore()
+        return log
+
+    def test_restore_skips_unflushed_seqs(self):
+        # The old owner flushed up to 12, then sent 13 and 14 and crashed
+        log = self.restored_log([10, 11, 12])
+        _, text, _ = log.append('{"type": "leaderboard"}')
+        self.assertGreater(log.seq, 14)
+        self.assertEqual(log.since(11), [['{"seq": 12}', None], [text, None]])
+        self.assertIsNone(log.since(13))
+        self.assertIsNone(log.since(14))
+        self.assertEqual(log.since(log.seq), [])
+
+
+@override_settings(CHANNEL_LAYERS=MEMORY_LAYER)
+class SlowSocketTests(SimpleTestCase):
+    code = 'SLOW01'
+
+    async def connect(self):
+        from quiz_app.asgi import application
+
+        socket = WebsocketCommunicator(application, f'/ws/game/{self.code}/')
+        await socket.connect()
+        return socket
+
+    async def broadcast(self, seq):
+        text = events.stamp(encode_frame('game_ended'), seq)
+        await send_frame(self.code, text, seq=seq)
+
+    async def test_lagging_client_is_dropped(self):
+        socket = await self.connect()
+        await socket.send_json_to({'type': 'ack', 'seq': 0})
+        await socket.receive_nothing()
+        for seq in range(1, MAX_UNACKED + 2):
+            await self.broadcast(seq)
+        for seq in range(1, MAX_UNACKED + 1):
+            self.assertEqual((await socket.receive_json_from())['seq'], seq)
+        closed = await socket.receive_output()
+        self.assertEqual(closed, {'type': 'websocket.close', 'code': CLOSE_TOO_SLOW})
+
+    async def test_acking_client_stays(self):
+        socket = await self.connect()
+        await socket.send_json_to({'type': 'ack', 'seq': 0})
+        for seq in range(1, 2 * MAX_UNACKED):
+            await self.broadcast(seq)
+            self.assertEqual((await socket.receive_json_from())['seq'], seq)
+            await socket.send_json_to({'type': 'ack', 'seq': seq})
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+    async def test_client_without_acks_is_not_tracked(self):
+        socket = await self.connect()
+        for seq in range(1, MAX_UNACKED + 2):
+            await self.broadcast(seq)
+        for seq in range(1, MAX_UNACKED + 2):
+            self.assertEqual((await socket.receive_json_from())['seq'], seq)
+        await socket.disconnect()
+
+
+class SubmitAnswerBodyTests(SimpleTestCase):
+    def post(self, body):
+        return Client().post('/api/submit-answer/', body, content_type='application/json')
+
+    def test_malformed_body(self):
+        for body in ('{"question_index": 0', b'\xff', '[0, 1]', '1', 'null'):
+            with self.subTest(body=body):
+                response = self.post(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid request'})
+
+
+class CodeSessionsTests(TestCase):
+    def setUp(self):
+        # A running write-behind thread would outlive the test
+        patcher = mock.patch.object(write_behind, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_newest_session_is_the_game(self):
+        quiz = Quiz.objects.create(title='Twice hosted', quiz_data={'questions': [
+            {'question': 'Ready?', 'options': ['Yes', 'No'], 'correct_answer': 0}
+        ]})
+        GameSession.objects.create(quiz=quiz, status='FINISHED')
+        newest = GameSession.objects.create(quiz=quiz)
+        self.addCleanup(game_state.drop_game, quiz.game_code)
+        self.assertEqual(game_state.code_sessions(quiz.game_code).first(), newest)
+        self.assertEqual(game_state.load_game(quiz.game_code).session_id, newest.id)
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        quiz = Quiz.objects.create(title='Analytics', quiz_data={'questions': [
+            {'question': 'Ready?', 'options': ['Yes', 'No'], 'correct_answer': 0}
+        ]})
+        self.code = quiz.game_code
+        self.session = GameSession.objects.create(quiz=quiz)
+        self.host = Client()
+        host_session = self.host.session
+        host_session['is_quiz_host'] = self.code
+        host_session.save()
+
+    def test_not_served_before_the_game_ends(self):
+        response = self.host.get(f'/api/analytics/{self.code}/')
+        self.assertEqual(response.status_code, 409)
+        self.assertNotIn('questions', response.json())
+
+    def test_host_only(self):
+        GameSession.objects.filter(id=self.session.id).update(status='FINISHED')
+        self.assertEqual(Client().get(f'/api/analytics/{self.code}/').status_code, 403)
+
+    def test_finished_game(self):
+        GameSession.objects.filter(id=self.session.id).update(status='FINISHED')
+        response = self.host.get(f'/api/analytics/{self.code}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['questions'][0]['correct_answer'], 0)
+
+
+class LiveGameTestCase(TestCase):
+    """A two-question game with two players, loaded into memory."""
+
+    def setUp(self):
+        patcher = mock.patch.object(write_behind, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.quiz = Quiz.objects.create(
+            title='Live game', time_per_question=30,
+            quiz_data={'questions': [
+                {'question': 'Ready?', 'options': ['Yes', 'No'], 'correct_answer': 0},
+                {'question': 'Steady?', 'options': ['Yes', 'No'], 'correct_answer': 1},
+            ]}
+        )
+        self.code = self.quiz.game_code
+        session = GameSession.objects.create(quiz=self.quiz)
+        self.players = [
+            Player.objects.create(session=session, name=name).id for name in ('ann', 'bob')
+        ]
+        self.addCleanup(game_state.drop_game, self.code)
+        # Runs first: nothing this test left pending reaches the next one
+        self.addCleanup(write_behind.flush_now)
+        self.game = game_state.load_game(self.code)
+
+
+class GameStartTests(LiveGameTestCase):
+    def test_start_only_from_waiting(self):
+        self.assertIsNotNone(self.game.start())
+        self.game.advance()
+        # A second host tab starting again must not rewind the game
+        self.assertIsNone(self.game.start())
+        self.assertEqual(self.game.current_question_index, 1)
+
+    def test_finished_game_stays_finished(self):
+        self.game.start()
+        self.game.finish()
+        self.assertIsNone(self.game.start())
+        self.assertEqual(self.game.status, 'FINISHED')
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+        self.assertEqual([bucket.take(0) for _ in range(4)], [True, True, True, False])
+        # Half a second buys one more
+        self.assertTrue(bucket.take(0.5))
+        self.assertFalse(bucket.take(0.5))
+
+    def test_refill_stops_at_burst(self):
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+        for _ in range(3):
+            bucket.take(0)
+        self.assertEqual([bucket.take(100) for _ in range(4)], [True, True, True, False])
+
+
+class AnswerBitmapTests(SimpleTestCase):
+    def test_one_answer_per_player_and_question(self):
+        bitmap = AnswerBitmap(questions=2)
+        self.assertTrue(bitmap.test_and_set(7, 0))
+        self.assertFalse(bitmap.test_and_set(7, 0))
+        self.assertTrue(bitmap.test_and_set(7, 1))
+        self.assertTrue(bitmap.test_and_set(8, 0))
+
+    def test_grows_with_players(self):
+        bitmap = AnswerBitmap(questions=1)
+        players = range(100, 120)
+        self.assertTrue(all(bitmap.test_and_set(player, 0) for player in players))
+        self.assertFalse(any(bitmap.test_and_set(player, 0) for player in players))
+
+
+class AnswerGateTests(LiveGameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.game.start()
+
+    def answer(self, player_id, question_index=0, received_at=None):
+        return ingest.submit_answer(
+            self.game, player_id, question_index, 0, received_at or time.time()
+        )
+
+    def test_first_answer_counts(self):
+        result = self.answer(self.players[0])
+        self.assertTrue(result['correct'])
+        self.assertEqual(self.answer(self.players[0]), {'error': 'Already answered'})
+        # Other players are not affected
+        self.assertNotIn('error', self.answer(self.players[1]))
+
+    def test_flood_is_rate_limited(self):
+        results = [self.answer(self.players[0]) for _ in range(PLAYER_BURST + 1)]
+        self.assertEqual(results[-1], {'error': 'Too many answers'})
+        self.assertEqual(self.game.scores[self.players[0]], results[0]['total_score'])
+
+    def test_closed_question(self):
+        self.game.close_question(0)
+        self.assertEqual(self.answer(self.players[0]), {'error': 'Question closed'})
+
+    def test_late_answer(self):
+        late = time.time() + self.game.time_per_question + game_state.ANSWER_GRACE + 1
+        self.assertEqual(self.answer(self.players[0], received_at=late), {'error': 'Question closed'})
+
+    def test_other_question(self):
+        self.assertEqual(self.answer(self.players[0], question_index=1),
+                         {'error': 'Question closed'})
+        self.assertIsNone(self.answer(self.players[0], question_index=2))
+
+    def test_answered_before_a_restart(self):
+        first = self.answer(self.players[0])
+        write_behind.flush_now()
+        # The process dies mid-question; another one loads the game
+        game_state.drop_game(self.code)
+        self.game = game_state.load_game(self.code)
+        self.assertEqual(self.answer(self.players[0]), {'error': 'Already answered'})
+        self.assertEqual(self.game.scores[self.players[0]], first['total_score'])
+        self.assertNotIn('error', self.answer(self.players[1]))
+
+
+@override_settings(CHANNEL_LAYERS=MEMORY_LAYER)
+class EndGameTests(LiveGameTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(flow, 'wheel')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.game.start()
+
+    def final_distributions(self, *steps):
+        with mock.patch.object(flow, 'send_distribution') as send:
+            for step in steps:
+                async_to_sync(step)()
+        return [call.args[0].current_question_index for call in send.call_args_list]
+
+    def test_past_the_last_question(self):
+        sent = self.final_distributions(
+            lambda: flow.next_question(self.game, 0),
+            lambda: flow.next_question(self.game, 1),
+        )
+        self.assertEqual(self.game.status, 'FINISHED')
+        self.assertEqual(len(sent), 2)
+
+    def test_ended_mid_question(self):
+        sent = self.final_distributions(lambda: flow.end_game(self.game))
+        self.assertEqual(self.game.status, 'FINISHED')
+        self.assertEqual(sent, [0])
+
+
+# The game is loaded on the engine's DB pool, outside a TestCase transaction
+class ReloadTests(TransactionTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(write_behind, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reloaded_active_game_gets_its_deadline(self):
+        # The process running the game restarted mid-question
+        quiz = Quiz.objects.create(title='Restarted', quiz_data={'questions': [
+            {'question': 'Ready?', 'options': ['Yes', 'No'], 'correct_answer': 0}
+        ]})
+        GameSession.objects.create(quiz=quiz, status='ACTIVE')
+        self.addCleanup(game_state.drop_game, quiz.game_code)
+        with mock.patch.object(flow, 'AUTO_ADVANCE', True), \
+                mock.patch.object(flow.wheel, 'schedule') as schedule:
+            async_to_sync(dispatch.execute)(quiz.game_code, 'roster', {})
+            async_to_sync(dispatch.execute)(quiz.game_code, 'roster', {})
+        schedule.assert_called_once()
+        self.assertEqual(schedule.call_args.args[0], quiz.game_code)
+
+
+class EvictionTests(LiveGameTestCase):
+    def test_idle_game_leaves_memory(self):
+        game_state.evict_games(now=time.monotonic() + game_state.IDLE_SECONDS + 1)
+        self.assertIsNone(game_state.peek_game(self.code))
+        self.assertIsNone(game_state._player_games.get(self.players[0]))
+
+    def test_recent_game_stays(self):
+        game_state.evict_games()
+        self.assertIs(game_state.peek_game(self.code), self.game)
+
+    def test_unflushed_game_stays(self):
+        self.game.start()
+        game_state.evict_games(now=time.monotonic() + game_state.IDLE_SECONDS + 1)
+        self.assertIs(game_state.peek_game(self.code), self.game)
+
+
+class CompactSessionsTests(TestCase):
+    def test_finished_without_end_time_is_archived(self):
+        quiz = Quiz.objects.create(title='Old', quiz_data={'questions': [
+            {'question': 'Ready?', 'options': ['Yes', 'No'], 'correct_answer': 0}
+        ]})
+        old = GameSession.objects.create(quiz=quiz, status='FINISHED')
+        recent = GameSession.objects.create(quiz=quiz, status='FINISHED')
+        for session in (old, recent):
+            Player.objects.create(session=session, name='ann')
+        GameSession.objects.filter(id=old.id).update(
+            created_at=timezone.now() - timedelta(days=31)
+        )
+        call_command('compact_sessions', stdout=StringIO())
+        self.assertEqual(list(SessionArchive.objects.values_list('session_id', flat=True)), [old.id])
+        self.assertEqual(list(GameSession.objects.values_list('id', flat=True)), [recent.id])
@@ -0,0 +1,118 @@
+"""Question deadlines for every live game on one hashed timer wheel.
+
+A single asyncio task per process walks the wheel one tick at a time and
+fires whatever is due in the current slot, so the cost of thousands of
+running games is one sleeping task and a dict lookup per tick, not a task
+or a database poll per game. The task exits when the wheel is empty and is
+started again by the next ``schedule``.
+
+Entries are keyed (by game code): scheduling replaces the previous
+deadline of the same key and ``cancel`` is O(1).
+"""
+import asyncio
+import logging
+import math
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TICK = getattr(settings, 'QUIZ_TIMER_TICK', 0.25)
+SLOTS = 512
+
+
+class TimerWheel:
+    def __init__(self, tick=TICK, slots=SLOTS):
+        self.tick = tick
+        self.slots = slots
+        # slot -> {key: (due tick, callback, args)}
+        self._wheel = [{} for _ in range(slots)]
+        # key -> slot, for replacing and cancelling entries
+        self._slot_of = {}
+        self._origin = time.monotonic()
+        self._current = 0
+        self._task = None
+        self._loop = None
+        self._running = set()
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def _tick_at(self, when):
+        return math.ceil((when - self._origin) / self.tick)
+
+    def schedule(self, key, when, callback, *args):
+        """Run ``await callback(*args)`` at monotonic time ``when``.
+
+        Calls from another running loop (``async_to_sync`` in a worker
+        thread) are handed over to the loop that runs the wheel.
+        """
+        if self._handed_over(self.schedule, key, when, callback, *args):
+            return
+        self.cancel(key)
+        if not self._slot_of:
+            # Idle wheel: skip the ticks that passed while nothing was due
+            self._current = max(
+                self._current, int((time.monotonic() - self._origin) / self.tick)
+            )
+        due = max(self._tick_at(when), self._current + 1)
+        slot = due % self.slots
+        self._wheel[slot][key] = (due, callback, args)
+        self._slot_of[key] = slot
+        self._ensure_running()
+
+    def cancel(self, key):
+        if self._handed_over(self.cancel, key):
+            return
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            self._wheel[slot].pop(key, None)
+
+    def _handed_over(self, method, *args):
+        loop = asyncio.get_running_loop()
+        if self._loop is None or self._loop is loop or not self._loop.is_running():
+            return False
+        self._loop.call_soon_threadsafe(method, *args)
+        return True
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        # First use, or the previous loop is gone with its task
+        self._loop = loop
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self._slot_of:
+            # Sleep to the next tick boundary, then catch up on every tick
+            # that elapsed (the loop may have been busy)
+            next_tick = self._origin + (self._current + 1) * self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            now_tick = int((time.monotonic() - self._origin) / self.tick)
+            while self._current < now_tick and self._slot_of:
+                self._current += 1
+                self._fire(self._current)
+
+    def _fire(self, tick):
+        bucket = self._wheel[tick % self.slots]
+        due = [key for key, (due_tick, _, _) in bucket.items() if due_tick <= tick]
+        for key in due:
+            _, callback, args = bucket.pop(key)
+            del self._slot_of[key]
+            # Each expiry runs on its own so a slow broadcast never holds
+            # up the deadlines behind it
+            task = self._loop.create_task(callback(*args))
+            self._running.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Question timer callback failed', exc_info=task.exception())
+
+
+wheel = TimerWheel()
@@ -0,0 +1,62 @@
+"""Signed player tokens.
+
+``join_quiz`` hands each player a token carrying their player id, game
+session id and game code, signed with ``SECRET_KEY``. The answer view,
+the play page and the game socket take the player from it with no
+database access; clients without one fall back to the browser session.
+
+Browsers get the token as a cookie, other clients send it in the
+``X-Player-Token`` header (or ``?token=`` on the socket URL).
+"""
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core import signing
+
+ENABLED = getattr(settings, 'QUIZ_PLAYER_TOKENS', True)
+MAX_AGE = getattr(settings, 'QUIZ_PLAYER_TOKEN_MAX_AGE', 24 * 60 * 60)
+COOKIE_NAME = 'quiz_player'
+HEADER = 'HTTP_X_PLAYER_TOKEN'
+SALT = 'quiz.player'
+
+
+class PlayerToken:
+    __slots__ = ('player_id', 'session_id', 'game_code')
+
+    def __init__(self, player_id, session_id, game_code):
+        self.player_id = player_id
+        self.session_id = session_id
+        self.game_code = game_code
+
+
+def issue(player_id, session_id, game_code):
+    return signing.dumps([player_id, session_id, game_code], salt=SALT)
+
+
+def verify(token):
+    """The token's ``PlayerToken``, or None if it is missing, forged or expired."""
+    if not ENABLED or not token:
+        return None
+    try:
+        player_id, session_id, game_code = signing.loads(token, salt=SALT, max_age=MAX_AGE)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return PlayerToken(player_id, session_id, game_code)
+
+
+def from_request(request):
+    return verify(request.META.get(HEADER) or request.COOKIES.get(COOKIE_NAME))
+
+
+def from_scope(scope):
+    # Cookies are parsed into the scope by the socket's auth middleware stack
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    token = query.get('token', [None])[0] or scope.get('cookies', {}).get(COOKIE_NAME)
+    return verify(token)
+
+
+def set_cookie(response, token):
+    response.set_cookie(
+        COOKIE_NAME, token, max_age=MAX_AGE, httponly=True, samesite='Lax',
+        secure=settings.SESSION_COOKIE_SECURE
+    )
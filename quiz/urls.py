@@ -8,15 +8,21 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('create/', views.create_quiz, name='create_quiz'),
     path('created/<str:game_code>/', views.quiz_created, name='quiz_created'),
+    path('qr/<str:game_code>.png', views.quiz_qr, name='quiz_qr'),
     path('host/<str:game_code>/', views.host_game, name='host_game'),
 
+    path('join/<str:game_code>/', views.join_game, name='join_game'),
     path('play/<str:game_code>/', views.play_game, name='play_game'),
     path('api/submit-answer/', views.submit_answer, name='submit_answer'),
     path('api/join-quiz/', views.join_quiz, name='join_quiz'),
     path('choose-quiz/', views.choose_quiz, name='choose_quiz'),
     path('api/quizzes/', views.api_quizzes, name='api_quizzes'),
+    path('api/import-quizzes/', views.api_import_quizzes, name='api_import_quizzes'),
     path('api/players/<str:game_code>/', views.api_players, name='api_players'),
     path('api/start-game/<str:game_code>/', views.api_start_game, name='api_start_game'),
     path('api/next-question/<str:game_code>/', views.api_next_question, name='api_next_question'),
     path('api/end-game/<str:game_code>/', views.api_end_game, name='api_end_game'),
+    path('api/leaderboard/<str:game_code>/', views.api_leaderboard, name='api_leaderboard'),
+    path('api/analytics/<str:game_code>/', views.api_analytics, name='api_analytics'),
+    path('metrics', views.prometheus_metrics, name='metrics'),
 ]
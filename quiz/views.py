@@ -1,80 +1,171 @@
 # --- Imports ---
 from django.views.decorators.http import require_GET
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.urls import reverse
+from django.http import (
+    Http404, HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse
+)
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from .models import Quiz, GameSession, Player
+from . import analytics, cluster, game_state, importer, listing, metrics, qr, tokens
+from .compiled import get_compiled_quiz
+from .db import db_sync_to_async
+from .leaderboard import RedisLeaderboard, redis_enabled
+from asgiref.sync import async_to_sync
 import json
+import time
+from functools import wraps
+
+def game_call(game_code, name, **args):
+    # Game commands run on whichever process owns the game
+    return async_to_sync(cluster.call)(game_code, name, **args)
+
+async def game_exists(game_code):
+    # A game live in this process needs no query
+    if game_state.peek_game(game_code) is not None:
+        return True
+    return await db_sync_to_async(game_state.code_sessions(game_code).exists)()
+
+# The hot JSON endpoints below are coroutines: under ASGI they run on the
+# event loop, game commands are awaited directly and the few queries left
+# go to the engine's DB pool (quiz/db.py). Django 4.2's csrf_exempt and
+# require_GET wrap views in plain functions, which would send them back
+# through the sync thread, hence these two.
+def async_csrf_exempt(view):
+    view.csrf_exempt = True
+    return view
+
+def async_require_GET(view):
+    @wraps(view)
+    async def inner(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        return await view(request, *args, **kwargs)
+    return inner
 
 # --- API Endpoints for Host Controls ---
-@csrf_exempt
-def api_start_game(request, game_code):
+@async_csrf_exempt
+async def api_start_game(request, game_code):
     if request.method == 'POST':
-        session = GameSession.objects.filter(quiz__game_code=game_code).first()
-        if not session:
+        if not await game_exists(game_code):
             return JsonResponse({'error': 'Session not found'}, status=404)
-        session.status = 'ACTIVE'
-        session.current_question_index = 0
-        session.save()
+        await cluster.call(game_code, 'start_game')
         return JsonResponse({'success': True})
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
-@csrf_exempt
-def api_next_question(request, game_code):
+@async_csrf_exempt
+async def api_next_question(request, game_code):
     if request.method == 'POST':
-        session = GameSession.objects.filter(quiz__game_code=game_code).first()
-        if not session:
+        if not await game_exists(game_code):
             return JsonResponse({'error': 'Session not found'}, status=404)
-        session.current_question_index += 1
-        session.save()
+        await cluster.call(game_code, 'next_question')
         return JsonResponse({'success': True})
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
-@csrf_exempt
-def api_end_game(request, game_code):
+@async_csrf_exempt
+async def api_end_game(request, game_code):
     if request.method == 'POST':
-        session = GameSession.objects.filter(quiz__game_code=game_code).first()
-        if not session:
+        if not await game_exists(game_code):
             return JsonResponse({'error': 'Session not found'}, status=404)
-        session.status = 'FINISHED'
-        session.save()
+        await cluster.call(game_code, 'end_game')
         return JsonResponse({'success': True})
     return JsonResponse({'error': 'Invalid request'}, status=400)
-# AJAX endpoint for live player count and list
-@require_GET
-def api_players(request, game_code):
-    try:
-        session = GameSession.objects.get(quiz__game_code=game_code)
-        players = session.players.all().order_by('joined_at')
-        data = {
-            'count': players.count(),
-            'players': [
-                {
-                    'id': p.id,
-                    'name': getattr(p, 'name', getattr(p, 'nickname', '')),
-                    'joined_at': p.joined_at.strftime('%H:%M') if hasattr(p, 'joined_at') else ''
-                }
-                for p in players
-            ]
-        }
-        return JsonResponse(data)
-    except GameSession.DoesNotExist:
+# AJAX endpoint for live player count and list.
+# Served from the in-memory roster: the ETag short-circuits unchanged
+# polls with a 304, and ?since=<version> returns only the changes.
+@async_require_GET
+async def api_players(request, game_code):
+    since = request.GET.get('since')
+    data = await cluster.call(
+        game_code, 'roster',
+        since=int(since) if since is not None and since.isdigit() else None
+    )
+    if data is None:
         return JsonResponse({'count': 0, 'players': []})
+
+    del data['type']
+    etag = data.pop('etag')
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    response = JsonResponse(data)
+    response['ETag'] = etag
+    return response
+
+@require_GET
 def api_quizzes(request):
-    quizzes = Quiz.objects.all().order_by('-created_at')
-    quiz_list = [
-        {
-            'title': quiz.title,
-            'description': quiz.description,
-            'game_code': quiz.game_code
-        }
-        for quiz in quizzes
+    cursor = request.GET.get('cursor')
+    limit = request.GET.get('limit')
+    page = listing.list_quizzes(
+        q=request.GET.get('q', ''),
+        cursor=int(cursor) if cursor and cursor.isdigit() else None,
+        limit=int(limit) if limit and limit.isdigit() else listing.PAGE_SIZE
+    )
+    return JsonResponse(page)
+
+# Bulk import for staff; the body is streamed, never loaded whole
+def api_import_quizzes(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    batch_size = request.GET.get('batch_size') or '500'
+    if not batch_size.isdigit() or int(batch_size) < 1:
+        return JsonResponse({'error': 'batch_size must be a positive integer'}, status=400)
+    stats = importer.import_quizzes(
+        importer.iter_json_records(request),
+        batch_size=min(int(batch_size), 5000),
+        dry_run=request.GET.get('dry_run') == '1'
+    )
+    stats['errors'] = [
+        {'record': number, 'error': message} for number, message in stats['errors']
     ]
-    return JsonResponse({'quizzes': quiz_list})
+    return JsonResponse(stats)
+
 def choose_quiz(request):
     return render(request, 'quiz/choose_quiz.html')
  
+NAME_MAX_LENGTH = Player._meta.get_field('name').max_length
+
+
+def admit_player(request, game_code, name):
+    """Join ``name`` to the game, seating it in this browser session.
+
+    Returns the join result; it has an ``error`` when the player was turned
+    away, and is None for an unknown game.
+    """
+    result = game_call(game_code, 'join', player_name=name)
+    if result is None or 'error' in result:
+        return result
+    request.session['player_id'] = result['player_id']
+    # Remove host flag if present (joining as participant)
+    request.session.pop('is_quiz_host', None)
+    if tokens.ENABLED:
+        result['player_token'] = tokens.issue(result['player_id'], result['session_id'], game_code)
+    return result
+
+
+async def player_identity(request):
+    """``(player_id, game_code)`` of the request's player, or ``(None, None)``.
+
+    A valid player token answers without touching the database; otherwise
+    the player comes from the browser session, read on the DB pool.
+    """
+    token = tokens.from_request(request)
+    if token is not None:
+        return token.player_id, token.game_code
+    return await db_sync_to_async(session_identity)(request)
+
+
+def session_identity(request):
+    player_id = request.session.get('player_id')
+    if not player_id:
+        return None, None
+    return player_id, game_state.player_game_code(player_id)
+
+
 @csrf_exempt
 def join_quiz(request):
     if request.method == 'POST':
@@ -82,20 +173,61 @@ def join_quiz(request):
         name = data.get('name', '').strip()
         if not name:
             return JsonResponse({'error': 'Name is required'}, status=400)
+        if len(name) > NAME_MAX_LENGTH:
+            return JsonResponse({'error': 'Name is too long'}, status=400)
+        game_code = str(data.get('game_code', '')).strip().upper()
+        if not game_code:
+            # No game picked yet (home page): remember the name for the
+            # join page instead of creating anything
+            request.session['player_name'] = name
+            return JsonResponse({'success': True})
 
-        # For demo: always create a new session for each join (or you can customize logic)
-        session = GameSession.objects.create(
-            quiz=Quiz.objects.first(),  # You may want to select a quiz differently
-            status='WAITING'
-        )
-        player = Player.objects.create(session=session, name=name)
-        # Remove host flag if present (joining as participant)
-        if 'is_quiz_host' in request.session:
-            del request.session['is_quiz_host']
-        return JsonResponse({'success': True, 'player_id': player.id, 'session_id': session.id})
+        result = admit_player(request, game_code, name)
+        if result is None:
+            return JsonResponse({'error': 'Game not found'}, status=404)
+        if 'error' in result:
+            return JsonResponse({'error': result['error']}, status=409)
+        data = {
+            'success': True,
+            'player_id': result['player_id'],
+            'session_id': result['session_id'],
+            'play_url': reverse('play_game', args=[game_code])
+        }
+        if 'player_token' in result:
+            data['player_token'] = result['player_token']
+        response = JsonResponse(data)
+        if 'player_token' in result:
+            tokens.set_cookie(response, result['player_token'])
+        return response
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+def join_game(request, game_code):
+    quiz = get_object_or_404(Quiz.objects.only('title', 'description', 'game_code'), game_code=game_code)
+    error = None
+    if request.method == 'POST':
+        name = request.POST.get('nickname', '').strip()
+        if not name:
+            error = 'Name is required'
+        elif len(name) > NAME_MAX_LENGTH:
+            error = 'Name is too long'
+        else:
+            result = admit_player(request, game_code, name)
+            if result is None:
+                raise Http404
+            if 'error' not in result:
+                response = redirect('play_game', game_code=game_code)
+                if 'player_token' in result:
+                    tokens.set_cookie(response, result['player_token'])
+                return response
+            error = result['error']
+    return render(request, 'quiz/join_game.html', {
+        'quiz': quiz,
+        'error': error,
+        'nickname': request.session.get('player_name', '')
+    })
+
+
 def home(request):
     return render(request, 'quiz/home.html')
 
@@ -104,13 +236,16 @@ def create_quiz(request):
         # Get form data
         title = request.POST.get('title')
         description = request.POST.get('description', '')
-        time_per_question = int(request.POST.get('time_per_question', 30))
+        time_per_question = request.POST.get('time_per_question', '30')
+        time_per_question = int(time_per_question) if time_per_question.isdigit() else 30
         
         # Get questions data (JSON format)
         questions_json = request.POST.get('questions_data')
         
         try:
             quiz_data = json.loads(questions_json)
+            # Quiz.save checks this too; checking here gives the form a message
+            importer.validate_quiz(quiz_data)
             
             # Create quiz
             quiz = Quiz.objects.create(
@@ -123,13 +258,28 @@ def create_quiz(request):
             request.session['is_quiz_host'] = str(quiz.game_code)
             return redirect('quiz_created', game_code=quiz.game_code)
             
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, TypeError):
             return render(request, 'quiz/create_quiz.html', {
                 'error': 'Invalid JSON format for questions'
             })
+        except importer.QuizFormatError as e:
+            return render(request, 'quiz/create_quiz.html', {'error': str(e)})
     
     return render(request, 'quiz/create_quiz.html')
 
+@require_GET
+def quiz_qr(request, game_code):
+    png = qr.cached_qr_png(game_code)
+    if png is None:
+        # Only render for real quizzes, so arbitrary codes can't fill the cache
+        if not Quiz.objects.filter(game_code=game_code).exists():
+            raise Http404
+        png = qr.get_qr_png(game_code)
+    response = HttpResponse(png, content_type='image/png')
+    # The URL carries a version of the join URL, so it can be cached for good
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 def quiz_created(request, game_code):
     quiz = get_object_or_404(Quiz, game_code=game_code)
     return render(request, 'quiz/quiz_created.html', {'quiz': quiz})
@@ -138,12 +288,13 @@ def host_game(request, game_code):
     quiz = get_object_or_404(Quiz, game_code=game_code)
     
     # Get or create game session
-    session, created = GameSession.objects.get_or_create(
-        quiz=quiz,
-        defaults={'status': 'WAITING'}
-    )
+    session = game_state.code_sessions(quiz.game_code).first()
+    if session is None:
+        session = GameSession.objects.create(quiz=quiz, status='WAITING')
     
-    players = session.players.all().order_by('-score')
+    # Initial lobby list from the in-memory roster; the socket keeps it live
+    roster = game_call(quiz.game_code, 'roster')
+    players = roster['players'] if roster else []
     
     # Only show controls if user is the creator (host)
     is_host = False
@@ -163,7 +314,11 @@ def host_game(request, game_code):
 
 def play_game(request, game_code):
     quiz = get_object_or_404(Quiz, game_code=game_code)
-    player_id = request.session.get('player_id')
+    token = tokens.from_request(request)
+    if token is not None and token.game_code == game_code:
+        player_id = token.player_id
+    else:
+        player_id = request.session.get('player_id')
     
     if not player_id:
         return redirect('join_game', game_code=game_code)
@@ -178,48 +333,124 @@ def play_game(request, game_code):
         'player': player
     })
 
-@csrf_exempt
-def submit_answer(request):
+# Answers turned away by the game rather than malformed
+ANSWER_ERROR_STATUS = {
+    'Question closed': 409,
+    'Already answered': 409,
+    'Too many answers': 429,
+}
+
+
+@async_csrf_exempt
+async def submit_answer(request):
     if request.method == 'POST':
-        data = json.loads(request.body)
-        player_id = request.session.get('player_id')
+        # Answers are timed by the server, whatever the client reports
+        received_at = time.time()
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            # Not JSON, or not UTF-8
+            data = None
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Invalid request'}, status=400)
+        player_id, game_code = await player_identity(request)
         
         if not player_id:
             return JsonResponse({'error': 'Not authenticated'}, status=401)
         
-        player = get_object_or_404(Player, id=player_id)
-        question_index = data.get('question_index')
-        selected_answer = data.get('selected_answer')
-        response_time = data.get('response_time', 0)
-        
-        # Get correct answer from quiz data
-        quiz_data = player.session.quiz.quiz_data
-        if question_index < len(quiz_data['questions']):
-            question = quiz_data['questions'][question_index]
-            correct_answer = question['correct_answer']
-            
-            is_correct = selected_answer == correct_answer
-            
-            # Calculate points (faster answers get more points)
-            points = 0
-            if is_correct:
-                base_points = question.get('points', 100)
-                time_bonus = max(0, (30 - response_time) / 30 * 50)  # Up to 50 bonus points
-                points = int(base_points + time_bonus)
-            
-            # Update player score
-            player.score += points
-            player.save()
-            
-            return JsonResponse({
-                'correct': is_correct,
-                'points_earned': points,
-                'total_score': player.score,
-                'correct_answer': correct_answer
-            })
+        if game_code is None:
+            return JsonResponse({'error': 'Player not found'}, status=404)
         
-        return JsonResponse({'error': 'Invalid question'}, status=400)
+        # Scored in memory; the score itself is written by the batched flush
+        result = await cluster.call(
+            game_code,
+            'submit_answer',
+            player_id=player_id,
+            question_index=data.get('question_index'),
+            selected_answer=data.get('selected_answer'),
+            received_at=received_at
+        )
+        if result is None:
+            return JsonResponse({'error': 'Game unavailable'}, status=503)
+        del result['type']
+        if 'error' in result:
+            status = ANSWER_ERROR_STATUS.get(result['error'], 400)
+            return JsonResponse(result, status=status)
+        return JsonResponse(result)
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
-    # leaderboard view removed
+@require_GET
+def api_leaderboard(request, game_code):
+    """Top N of a game, plus the rank of ``?player_id=`` if given."""
+    limit = request.GET.get('limit')
+    limit = max(1, min(int(limit) if limit and limit.isdigit() else 10, 100))
+    player_id = request.GET.get('player_id')
+    player_id = int(player_id) if player_id and player_id.isdigit() else None
+
+    if not cluster.enabled() and game_state.peek_game(game_code) is None and redis_enabled():
+        # Not live in this process: read the Redis mirror instead of
+        # loading the whole game
+        session_id = game_state.code_sessions(game_code).values_list('id', flat=True).first()
+        if session_id is None:
+            return JsonResponse({'top': [], 'total_players': 0})
+        board = RedisLeaderboard(session_id)
+        top = board.top(limit)
+        names = dict(Player.objects.filter(
+            id__in=[pid for pid, _ in top]
+        ).values_list('id', 'name'))
+        data = {
+            'top': [
+                {'rank': rank, 'id': pid, 'name': names.get(pid, ''), 'score': score}
+                for rank, (pid, score) in enumerate(top, 1)
+            ],
+            'total_players': len(board)
+        }
+        if player_id is not None:
+            rank = board.rank(player_id)
+            if rank is not None:
+                data['me'] = {'rank': rank, 'score': board.score(player_id)}
+        return JsonResponse(data)
+
+    data = game_call(game_code, 'leaderboard', limit=limit, player_id=player_id)
+    if data is None:
+        return JsonResponse({'top': [], 'total_players': 0})
+    del data['type']
+    me = data.pop('me')
+    if me is not None:
+        data['me'] = {'rank': me['rank'], 'score': me['score']}
+    return JsonResponse(data)
+
+
+@require_GET
+def api_analytics(request, game_code):
+    """Per-question answer statistics of the code's session, for its host.
+
+    The report carries the correct answers, so it is only served once the
+    game is over.
+    """
+    if request.session.get('is_quiz_host') != game_code:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    session = game_state.code_sessions(game_code).values('id', 'quiz_id', 'status').first()
+    if session is None:
+        return JsonResponse({'error': 'Session not found'}, status=404)
+    # The live game is ahead of its row until the next flush
+    game = game_state.peek_game(game_code)
+    status = game.status if game is not None else session['status']
+    if status != 'FINISHED':
+        return JsonResponse({'error': 'Game not finished'}, status=409)
+    compiled = get_compiled_quiz(session['quiz_id'])
+    if compiled is None:
+        return JsonResponse({'error': 'Session not found'}, status=404)
+    hardest = request.GET.get('hardest', '5')
+    hardest = min(int(hardest), 50) if hardest.isdigit() else 5
+    columns = analytics.load_columns(session['id'])
+    return JsonResponse(analytics.report(columns, compiled, hardest=hardest))
+
+
+@require_GET
+def prometheus_metrics(request):
+    # Per-process: each worker is scraped on its own
+    if not metrics.ENABLED:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4')
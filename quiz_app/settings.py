@@ -20,6 +20,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'quiz.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,12 +50,47 @@ TEMPLATES = [
 
 ASGI_APPLICATION = 'quiz_app.asgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database profile: QUIZ_DB=sqlite (default, one host) or QUIZ_DB=postgres.
+# The game engine talks to the database from a fixed pool of
+# QUIZ_DB_THREADS threads that keep their connections (see quiz/db.py).
+QUIZ_DB = os.environ.get('QUIZ_DB', 'sqlite')
+
+if QUIZ_DB == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'quizmaster'),
+            'USER': os.environ.get('POSTGRES_USER', 'quizmaster'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Request threads under ASGI are short-lived, so their
+            # connections must not persist; the engine pool's do
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    # Sized like the ASGI thread pool; each worker process opens up to
+    # QUIZ_DB_THREADS + ASGI_THREADS connections at peak
+    QUIZ_DB_THREADS = int(os.environ.get('QUIZ_DB_THREADS', os.environ.get('ASGI_THREADS', '8')))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Busy timeout (seconds) before "database is locked"
+            'OPTIONS': {'timeout': 20},
+        }
     }
-}
+    # One writer: SQLite serializes writes anyway, queueing them in
+    # process is cheaper than contending for the file lock
+    QUIZ_DB_THREADS = 1
+    # WAL lets readers run alongside the writer; synchronous=NORMAL is
+    # durable across application crashes and skips an fsync per commit
+    if os.environ.get('QUIZ_SQLITE_WAL', '1') == '1':
+        QUIZ_SQLITE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL'}
+    else:
+        QUIZ_SQLITE_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
 
 
 
@@ -70,3 +106,94 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CSRF_TRUSTED_ORIGINS = [
     "https://quizmaster-kyxg.onrender.com"
 ]
+
+# Live game engine: how often in-memory game state is written back to the DB
+QUIZ_FLUSH_INTERVAL = float(os.environ.get('QUIZ_FLUSH_INTERVAL', '1.0'))
+# Live games with no command for this many seconds are dropped from memory
+# (and, with QUIZ_CLUSTER, their lease released); the next one reloads them
+QUIZ_IDLE_GAME_SECONDS = 30 * 60
+
+# Channel layer used for game broadcasts. Redis is required as soon as more
+# than one server process is involved; the in-memory layer only serves a
+# single process (local development and benchmarks).
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+if os.environ.get('QUIZ_CHANNEL_LAYER', 'redis') == 'memory':
+    CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        },
+    }
+
+# Compiled quiz cache: entries kept per process, and how many seconds a
+# process trusts its copy before re-reading the shared Django cache
+QUIZ_COMPILED_CACHE_SIZE = 256
+QUIZ_COMPILED_LOCAL_TTL = 30
+
+# Mirror each live game's ranking into a Redis sorted set (REDIS_URL) so
+# processes that don't hold the game can answer leaderboard queries
+QUIZ_LEADERBOARD_REDIS = os.environ.get('QUIZ_LEADERBOARD_REDIS') == '1'
+
+# Hot-path metrics on /metrics (quiz/metrics.py). QUIZ_METRICS_SAMPLE is
+# the share of requests and socket messages measured; lower it in
+# production to keep the overhead down
+QUIZ_METRICS = os.environ.get('QUIZ_METRICS', '1') == '1'
+QUIZ_METRICS_SAMPLE = float(os.environ.get('QUIZ_METRICS_SAMPLE', '1.0'))
+
+# Public base URL players use to join; encoded into the QR codes
+QUIZ_JOIN_BASE_URL = os.environ.get('QUIZ_JOIN_BASE_URL', 'http://localhost:8000')
+
+# Question deadlines are enforced by the server: answers are timed on
+# arrival, accepted up to QUIZ_ANSWER_GRACE seconds late, and the game
+# moves on QUIZ_REVEAL_SECONDS after the deadline unless auto-advance is off
+QUIZ_AUTO_ADVANCE = os.environ.get('QUIZ_AUTO_ADVANCE', '1') == '1'
+QUIZ_ANSWER_GRACE = 1.0
+QUIZ_REVEAL_SECONDS = 2.0
+QUIZ_TIMER_TICK = 0.25
+
+# Answer rate limits (token buckets: per second, burst), checked in memory
+# before scoring; repeated answers to a question are refused outright
+QUIZ_PLAYER_ANSWER_RATE = 2.0
+QUIZ_PLAYER_ANSWER_BURST = 5
+QUIZ_GAME_ANSWER_RATE = 2000.0
+QUIZ_GAME_ANSWER_BURST = 5000
+
+# Answer distribution snapshots pushed to host screens per second, at most,
+# while a question is open (coalesced; one more always goes out on close)
+QUIZ_DISTRIBUTION_RATE = 4
+
+# Game-wide frames kept per game for sockets that reconnect and resume;
+# mirrored to a Redis stream when Redis is in use (see quiz/events.py)
+QUIZ_EVENT_LOG_SIZE = 256
+
+# Logged frames a socket may leave unacknowledged before it is dropped as too slow
+QUIZ_SOCKET_MAX_UNACKED = 32
+
+# Signed player tokens, issued on join: answers and sockets identify the
+# player without reading the session (see quiz/tokens.py)
+QUIZ_PLAYER_TOKENS = os.environ.get('QUIZ_PLAYER_TOKENS', '1') == '1'
+QUIZ_PLAYER_TOKEN_MAX_AGE = 24 * 60 * 60
+# Clients without a token: sessions are read from the cache, the database
+# only on a miss
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Multi-worker mode: run several Daphne processes behind one load balancer.
+# Each live game is owned by one worker (a Redis lease); the others forward
+# its commands over the channel layer. Needs the Redis channel layer, and
+# moves the Django cache (and with it cached sessions) to Redis so every
+# worker sees them.
+QUIZ_CLUSTER = os.environ.get('QUIZ_CLUSTER') == '1'
+QUIZ_CLUSTER_LEASE = 5.0
+
+if QUIZ_CLUSTER:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }